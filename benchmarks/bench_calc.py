@@ -0,0 +1,159 @@
+# 電卓（lecture4/calculator）のキー処理を画面なしで測るベンチマーク
+# 同じ乱数の種から作ったキー列を calc_core.machine.Calculator に押させ、キーの種類ごとの時間と1秒あたりのキー数を出す
+# 使い方:
+#   python benchmarks/bench_calc.py                         float / decimal / fraction を測る
+#   python benchmarks/bench_calc.py --keys 200000 --numeric decimal
+#   python benchmarks/bench_calc.py --save-baseline         結果を基準として保存する
+# 基準（benchmarks/baseline_calc.json）があれば比べ、p50 が --tolerance 以上遅くなった項目があれば終了コード1
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lecture4" / "calculator" / "src"))
+from calc_core.machine import CLEAR, KEY_FUNCTIONS, OPERATOR_KEYS, Calculator
+from calc_core.numeric import BACKENDS
+
+BASELINE = Path(__file__).with_name("baseline_calc.json")
+KEYS = 50_000
+CHUNK = 100  # 続けて押すキーの数。1キーずつ時間を測ると perf_counter の分が目立つので、まとめて測る
+OPS_PER_RUN = 8  # この数の演算ごとに = か AC で区切る（fraction の分母が大きくなりすぎないように）
+MIN_DELTA_MS = 0.001  # これより小さい差（ミリ秒）は誤差として見逃す
+# キーの種類（結果の項目名）
+CATEGORIES = {CLEAR: "clear", "=": "equals", "%": "function", "+/-": "function"}
+CATEGORIES.update({k: "operator" for k in OPERATOR_KEYS})
+CATEGORIES.update({k: "function" for k in KEY_FUNCTIONS})
+
+
+# --- キー列 ---
+
+def number_keys(rng):
+    # よく使う数（0〜999、小数1〜2桁）。同じ値がときどき出るので関数キーのメモも効く
+    text = str(rng.randint(0, 999))
+    if rng.random() < 0.3:
+        text += "." + str(rng.randint(1, 99))
+    return list(text)
+
+
+def make_keys(count, seed=1):
+    rng = random.Random(seed)
+    keys = []
+    while len(keys) < count:
+        keys.append(CLEAR)
+        for _ in range(rng.randint(1, OPS_PER_RUN)):
+            keys.extend(number_keys(rng))
+            if rng.random() < 0.25:
+                keys.append(rng.choice(list(KEY_FUNCTIONS) + ["%", "+/-"]))
+            keys.append(rng.choice(OPERATOR_KEYS))
+        keys.extend(number_keys(rng))
+        keys.append("=")
+    return keys[:count]
+
+
+# --- 計測 ---
+
+def summarize(durations):
+    # durations: 1回ごとの秒数
+    values = sorted(durations)
+    total = sum(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return {"n": len(values), "ops_per_sec": round(len(values) / total, 1) if total else 0.0,
+            "p50_ms": round(pick(0.50), 4), "p99_ms": round(pick(0.99), 4)}
+
+
+def bench_throughput(name, keys):
+    # CHUNK キーずつまとめて押し、1キーあたりの時間にする
+    calc = Calculator(name, trace=False)
+    durations = []
+    for i in range(0, len(keys), CHUNK):
+        chunk = keys[i:i + CHUNK]
+        t = time.perf_counter()
+        calc.feed(chunk)
+        durations.extend([(time.perf_counter() - t) / len(chunk)] * len(chunk))
+    return {f"{name}/keys": summarize(durations)}, calc
+
+
+def bench_per_key(name, keys):
+    # キーの種類ごとの時間（数字キーも含む）
+    calc = Calculator(name, trace=False)
+    press = calc.press
+    durations = {}
+    for key in keys:
+        t = time.perf_counter()
+        press(key)
+        durations.setdefault(CATEGORIES.get(key, "digit"), []).append(time.perf_counter() - t)
+    return {f"{name}/{category}": summarize(values) for category, values in sorted(durations.items())}
+
+
+def bench_replay(name, calc):
+    # 記録したテープ（リングバッファに残っている分）を計算し直す
+    tape = calc.tape
+    durations = []
+    for _ in range(5):
+        t = time.perf_counter()
+        tape.replay()
+        durations.extend([(time.perf_counter() - t) / len(tape)] * len(tape))
+    return {f"{name}/replay": summarize(durations)}
+
+
+# --- 基準との比較 ---
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        delta = now["p50_ms"] - before["p50_ms"]
+        if now["p50_ms"] > before["p50_ms"] * (1 + tolerance) and delta > MIN_DELTA_MS:
+            regressions.append((name, before["p50_ms"], now["p50_ms"]))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'項目':22s} {'n':>8s} {'keys/sec':>11s} {'p50 ms':>9s} {'p99 ms':>9s}")
+    for name, r in results.items():
+        print(f"{name:24s} {r['n']:8d} {r['ops_per_sec']:11.1f} {r['p50_ms']:9.4f} {r['p99_ms']:9.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="電卓のキー処理のベンチマーク（画面なし）")
+    parser.add_argument("--keys", type=int, default=KEYS, help="押すキーの数")
+    parser.add_argument("--numeric", default=",".join(BACKENDS), help="数の種類（カンマ区切り）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="p50 がこの割合以上遅くなったら失敗にする")
+    parser.add_argument("--json", type=Path, help="結果を JSON で保存する")
+    args = parser.parse_args()
+
+    keys = make_keys(args.keys, args.seed)
+    print(f"キー列: {len(keys)}キー（seed={args.seed}）", flush=True)
+    results = {}
+    for name in args.numeric.split(","):
+        throughput, calc = bench_throughput(name, keys)
+        results.update(throughput)
+        results.update(bench_per_key(name, keys))
+        results.update(bench_replay(name, calc))
+
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"基準を保存しました: {args.baseline}")
+        return 0
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for name, before, now in regressions:
+            print(f"⚠️ 遅くなりました: {name}  p50 {before:.4f} ms → {now:.4f} ms")
+        if regressions:
+            return 1
+        print("基準と比べて遅くなった項目はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# forecasts テーブルのインデックス追加前後で検索時間を比べるベンチマーク
+# 使い方: python benchmarks/bench_forecast_index.py [行数]
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from weather_core import store
+
+REGIONS = 150
+DAYS = 7
+
+
+def fill(db, rows):
+    # 1時間ごとのポーリングを想定して (地域 × 取得時刻 × 7日分) を入れる
+    snapshots = max(1, rows // (REGIONS * DAYS))
+    start = datetime(2026, 1, 1)
+    params = []
+    for s in range(snapshots):
+        fetched_at = (start + timedelta(hours=s)).strftime("%Y-%m-%d %H:%M:%S")
+        for r in range(REGIONS):
+            for d in range(DAYS):
+                date = (start + timedelta(hours=s, days=d)).strftime("%Y-%m-%d")
+                params.append((f"{r:06d}", date, fetched_at, "晴れ", 20.0, 10.0, 30, "100"))
+    with db.conn:
+        db.conn.executemany(store.INSERT_FORECAST_OR_IGNORE_SQL, params)
+    return len(params)
+
+
+def measure(db, repeat=50):
+    codes = [f"{r:06d}" for r in range(0, REGIONS, max(1, REGIONS // repeat))][:repeat]
+    results = {}
+    for name, func in (("get_forecasts", db.get_forecasts), ("get_history", db.get_history)):
+        t = time.perf_counter()
+        for code in codes:
+            func(code)
+        results[name] = (time.perf_counter() - t) / len(codes) * 1000
+    return results
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = store.WeatherStore(os.path.join(tmp, "bench.db"))
+        db.init_db()
+        n = fill(db, rows)
+        print(f"{n} 行")
+        # インデックス（マイグレーション1）を外した状態と付けた状態で比べる
+        db.conn.execute("DROP INDEX idx_forecasts_region_fetched")
+        db.conn.execute("ANALYZE forecasts")
+        before = measure(db)
+        db.conn.execute(store.MIGRATIONS[0])
+        db.conn.execute("ANALYZE forecasts")
+        after = measure(db)
+        db.close()
+    for name in before:
+        print(f"{name:15s} 追加前 {before[name]:8.3f} ms  追加後 {after[name]:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
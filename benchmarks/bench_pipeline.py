@@ -0,0 +1,282 @@
+# 気象庁の予報JSON（録っておいたもの）でパース・保存・検索をまとめて測るベンチマーク
+# ネットワークには出ない。--fixtures を渡さなければ気象庁と同じ形のJSONをその場で作る（毎回同じ中身）
+# 使い方:
+#   python benchmarks/bench_pipeline.py                       10k / 1M 行の履歴で測る
+#   python benchmarks/bench_pipeline.py --sizes 10k,1m,10m    10M 行も測る
+# 10M 行は履歴を作るだけで1分半ほどかかり、一時フォルダに1GBほどのDBを作るので既定では測らない
+# 基準には 10M 行の分も入れてあるので、--sizes に 10m を足せば同じように比べられる
+#   python benchmarks/bench_pipeline.py --fixtures DIR        録ったJSONを使う（JMA_FIXTURE_DIR と同じ並び）
+#   python benchmarks/bench_pipeline.py --record DIR          気象庁から全オフィス分を録る（ここだけネットワークを使う）
+#   python benchmarks/bench_pipeline.py --save-baseline       結果を基準として保存する
+# 基準（benchmarks/baseline.json）があれば比べ、p50 が --tolerance 以上遅くなった項目があれば終了コード1
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from weather_core import fetch, store
+from weather_core.parse import area_regions, parse_office_forecast
+from weather_core.refresh import office_regions
+
+BASELINE = Path(__file__).with_name("baseline.json")
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+OFFICES = 58  # 気象庁の府県予報区の数
+REGIONS_PER_OFFICE = 4
+DAYS = 7
+QUERIES = 200
+MIN_DELTA_MS = 0.1  # これより小さい差（ミリ秒）は誤差として見逃す
+WEATHER_CODES = ("100", "101", "110", "200", "201", "211", "300", "313", "400")
+
+
+# --- fixture ---
+
+def _iso(t):
+    return t.strftime("%Y-%m-%dT%H:%M:%S+09:00")
+
+
+def synthetic_office(regions, rng, base):
+    # 気象庁の府県天気予報（短期＋週間）と同じ形のJSON
+    near = [_iso(base + timedelta(days=d)) for d in range(3)]
+    pops = [_iso(base + timedelta(hours=6 * h)) for h in range(6)]
+    week = [_iso(base + timedelta(days=d)) for d in range(1, 8)]
+    temps = lambda: [str(rng.randint(0, 30)) for _ in week]
+    return [
+        {"publishingOffice": "気象庁", "reportDatetime": _iso(base), "timeSeries": [
+            {"timeDefines": near, "areas": [
+                {"area": {"name": r, "code": r}, "weatherCodes": [rng.choice(WEATHER_CODES) for _ in near],
+                 "weathers": ["晴れ　時々　くもり"] * len(near), "winds": ["北の風"] * len(near)}
+                for r in regions]},
+            {"timeDefines": pops, "areas": [
+                {"area": {"name": r, "code": r}, "pops": [str(rng.randint(0, 10) * 10) for _ in pops]}
+                for r in regions]},
+            {"timeDefines": [_iso(base + timedelta(hours=h)) for h in (0, 9, 24, 33)], "areas": [
+                {"area": {"name": "代表地点", "code": "00000"}, "temps": [str(rng.randint(0, 30)) for _ in range(4)]}]},
+        ]},
+        {"publishingOffice": "気象庁", "reportDatetime": _iso(base), "timeSeries": [
+            {"timeDefines": week, "areas": [
+                {"area": {"name": regions[0], "code": regions[0]},
+                 "weatherCodes": [rng.choice(WEATHER_CODES) for _ in week],
+                 "pops": [""] + [str(rng.randint(0, 10) * 10) for _ in week[1:]],
+                 "reliabilities": ["", ""] + ["A"] * (len(week) - 2)}]},
+            {"timeDefines": week, "areas": [
+                {"area": {"name": "代表地点", "code": "00000"}, "tempsMin": [""] + temps()[1:],
+                 "tempsMinUpper": temps(), "tempsMinLower": temps(),
+                 "tempsMax": [""] + temps()[1:], "tempsMaxUpper": temps(), "tempsMaxLower": temps()}]},
+        ]},
+    ]
+
+
+def make_fixtures(root, offices=OFFICES, regions_per_office=REGIONS_PER_OFFICE, seed=1):
+    # 全オフィス分の area.json と予報JSONを root に作る
+    rng = random.Random(seed)
+    base = datetime(2026, 1, 1, 11)
+    area = {"centers": {"010000": {"name": "全国", "children": []}}, "offices": {}, "class10s": {}}
+    forecast_dir = root / "forecast" / "data" / "forecast"
+    forecast_dir.mkdir(parents=True, exist_ok=True)
+    for o in range(offices):
+        office_code = f"{o + 1:02d}0000"
+        regions = [f"{o + 1:02d}00{r + 1:02d}" for r in range(regions_per_office)]
+        area["centers"]["010000"]["children"].append(office_code)
+        area["offices"][office_code] = {"name": f"府県{o + 1}", "children": regions, "parent": "010000"}
+        for r in regions:
+            area["class10s"][r] = {"name": f"地域{r}", "parent": office_code}
+        data = synthetic_office(regions, rng, base)
+        (forecast_dir / f"{office_code}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    (root / "common" / "const").mkdir(parents=True, exist_ok=True)
+    (root / "common" / "const" / "area.json").write_text(json.dumps(area, ensure_ascii=False), encoding="utf-8")
+
+
+def record_fixtures(root):
+    # 気象庁から area.json と全オフィスの予報を録る
+    area = fetch.get_area()
+    (root / "common" / "const").mkdir(parents=True, exist_ok=True)
+    (root / "common" / "const" / "area.json").write_text(json.dumps(area, ensure_ascii=False), encoding="utf-8")
+    forecast_dir = root / "forecast" / "data" / "forecast"
+    forecast_dir.mkdir(parents=True, exist_ok=True)
+    for office_code in office_regions(area_regions(area)):
+        try:
+            data = fetch.get_office_forecast(office_code)
+        except fetch.FetchError as e:
+            print(f"  失敗 {office_code}: {e}")
+            continue
+        (forecast_dir / f"{office_code}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def load_fixtures(root):
+    # ({office_code: [region_code]}, {office_code: JSON文字列})
+    area = json.loads((root / "common" / "const" / "area.json").read_text(encoding="utf-8"))
+    offices = {code: [r.region_code for r in regions] for code, regions in office_regions(area_regions(area)).items()}
+    texts = {}
+    for office_code in offices:
+        path = root / "forecast" / "data" / "forecast" / f"{office_code}.json"
+        if path.exists():
+            texts[office_code] = path.read_text(encoding="utf-8")
+    return offices, texts
+
+
+# --- 計測 ---
+
+def summarize(durations):
+    # durations: 1回ごとの秒数
+    values = sorted(durations)
+    total = sum(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return {"n": len(values), "ops_per_sec": round(len(values) / total, 1) if total else 0.0,
+            "p50_ms": round(pick(0.50), 4), "p99_ms": round(pick(0.99), 4)}
+
+
+def timed(func, args_list):
+    durations = []
+    for args in args_list:
+        t = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - t)
+    return durations
+
+
+def bench_parse(offices, texts, repeat):
+    decoded = {code: json.loads(text) for code, text in texts.items()}
+    return {
+        "decode": summarize(timed(json.loads, [(texts[c],) for c in texts] * repeat)),
+        "parse": summarize(timed(parse_office_forecast,
+                                 [(decoded[c], c, offices[c]) for c in decoded] * repeat)),
+    }
+
+
+def bench_save(offices, texts, tmp, repeat):
+    db = store.WeatherStore(os.path.join(tmp, "save.db"))
+    db.init_db()
+    parsed = [parse_office_forecast(json.loads(texts[c]), c, offices[c]) for c in texts]
+    # 毎回ちがう発表として保存する（同じ内容だと保存が飛ばされる）
+    args = [(rows, (), {code: f"report-{i}" for code in rows}) for i in range(repeat) for rows in parsed]
+    counts = []
+
+    def save(rows_by_region, watermarks, reports):
+        counts.append((db.save_forecasts_many(rows_by_region, watermarks, reports),
+                       sum(len(rows) for rows in rows_by_region.values())))
+
+    results = {"save_forecasts_many": summarize(timed(save, args))}
+    # 1回でも行が無視されたら、書き込みではなく何もしない INSERT を測っていることになる
+    for (inserted, ignored), total in counts:
+        if inserted != total:
+            raise SystemExit(f"save_forecasts_many で {ignored}/{total} 行が保存されませんでした")
+    single = [("S00001", "2026-01-01", "晴れ", 20, 10, 30)] * (repeat * 200)
+    results["save_forecast"] = summarize(timed(db.save_forecast, single))
+    db.close()
+    return results
+
+
+def fill(db, region_codes, rows):
+    # 6時間ごとの取得を想定して (取得時刻 × 地域 × 7日分) の行を rows 行ぶん入れる
+    start = datetime(2025, 1, 1)
+    snapshots = max(1, rows // (len(region_codes) * DAYS))
+
+    def generate():
+        for s in range(snapshots):
+            t = start + timedelta(hours=6 * s)
+            fetched_at = t.strftime("%Y-%m-%d %H:%M:%S")
+            dates = [(t + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(DAYS)]
+            for code in region_codes:
+                for date in dates:
+                    yield code, date, fetched_at, "晴れ", 20.0, 10.0, 30, "100"
+
+    with db.conn:
+        db.conn.executemany(store.INSERT_FORECAST_OR_IGNORE_SQL, generate())
+    db.conn.execute("ANALYZE forecasts")
+    return snapshots * len(region_codes) * DAYS
+
+
+def bench_queries(region_codes, size_name, rows, tmp):
+    path = os.path.join(tmp, f"history-{size_name}.db")
+    db = store.WeatherStore(path)
+    db.init_db()
+    t = time.perf_counter()
+    n = fill(db, region_codes, rows)
+    print(f"  {size_name}: {n}行を用意（{time.perf_counter() - t:.1f}秒）", flush=True)
+    rng = random.Random(size_name)
+    codes = [(rng.choice(region_codes),) for _ in range(QUERIES)]
+    results = {}
+    for name, func in (("get_forecasts", db.get_forecasts), ("get_history", db.get_history),
+                       ("get_history_page", db.get_history_page)):
+        results[f"{name}@{size_name}"] = summarize(timed(func, codes))
+    db.close()
+    os.remove(path)
+    return results
+
+
+# --- 基準との比較 ---
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        delta = now["p50_ms"] - before["p50_ms"]
+        if now["p50_ms"] > before["p50_ms"] * (1 + tolerance) and delta > MIN_DELTA_MS:
+            regressions.append((name, before["p50_ms"], now["p50_ms"]))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'項目':28s} {'n':>6s} {'ops/sec':>10s} {'p50 ms':>9s} {'p99 ms':>9s}")
+    for name, r in results.items():
+        print(f"{name:30s} {r['n']:6d} {r['ops_per_sec']:10.1f} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="天気予報の取得〜保存〜検索のベンチマーク（オフライン）")
+    parser.add_argument("--fixtures", type=Path, help="録った fixture のフォルダ")
+    parser.add_argument("--record", type=Path, help="気象庁から fixture を録ってこのフォルダに保存して終わる")
+    parser.add_argument("--sizes", default="10k,1m", help=f"履歴の行数（{', '.join(SIZES)} をカンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=5, help="パース・保存を繰り返す回数")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="p50 がこの割合以上遅くなったら失敗にする")
+    parser.add_argument("--json", type=Path, help="結果を JSON で保存する")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.fixtures
+        if root is None:
+            root = Path(tmp) / "fixtures"
+            make_fixtures(root)
+        offices, texts = load_fixtures(root)
+        region_codes = [code for codes in offices.values() for code in codes]
+        print(f"fixture: {len(texts)}オフィス / {len(region_codes)}地域", flush=True)
+
+        results = {}
+        results.update(bench_parse(offices, texts, args.repeat))
+        results.update(bench_save(offices, texts, tmp, args.repeat))
+        for size_name in args.sizes.split(","):
+            results.update(bench_queries(region_codes, size_name, SIZES[size_name], tmp))
+
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"基準を保存しました: {args.baseline}")
+        return 0
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for name, before, now in regressions:
+            print(f"⚠️ 遅くなりました: {name}  p50 {before:.3f} ms → {now:.3f} ms")
+        if regressions:
+            return 1
+        print("基準と比べて遅くなった項目はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# 電卓（calc_core.machine.Calculator）の性質を乱数のキー列でまとめて確かめる
+# 例を1つずつ書く代わりに「どんな数・どんなキー列でも成り立つこと」を何百通りも試す
+# 使い方:
+#   python benchmarks/check_calc.py                         float / decimal / fraction で 300 通りずつ
+#   python benchmarks/check_calc.py --examples 5000 --seed 7
+# 成り立たない例が見つかったら、キーを1つずつ減らしてもまだ失敗する一番短いキー列を出し、終了コード1
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "lecture4" / "calculator" / "src"))
+from calc_core.expr import CalcError, evaluate
+from calc_core.machine import CLEAR, ERROR, KEY_FUNCTIONS, KEYS, OPERATOR_KEYS, Calculator
+from calc_core.numeric import BACKENDS, get_backend
+
+try:
+    from calc_core import batch  # numpy があれば一括計算とも比べる
+except ImportError:
+    batch = None
+
+EXAMPLES = 300
+MAX_KEYS = 40  # でたらめなキー列の長さ
+
+
+# --- 数とキー列を作る ---
+
+def number_text(rng, decimals=2, zero=0.05):
+    # 電卓で打てる数（0〜999、小数は decimals 桁まで）。ときどき 0（0で割るを試す）
+    if rng.random() < zero:
+        return "0"
+    text = str(rng.randint(0, 999))
+    if decimals and rng.random() < 0.4:
+        text += "." + str(rng.randint(1, 10 ** decimals - 1)).rjust(rng.randint(1, decimals), "0")
+    return text
+
+
+def random_keys(rng):
+    return [rng.choice(KEYS) for _ in range(rng.randint(1, MAX_KEYS))]
+
+
+def run(name, keys):
+    calc = Calculator(name, trace=False)
+    calc.feed(keys)
+    return calc
+
+
+def expected(backend, func):
+    # 期待する表示。計算できないときは "Error"
+    try:
+        value = func()
+    except (ArithmeticError, ValueError):
+        return ERROR
+    return backend.format(value)
+
+
+# --- 性質（決まった形のキー列） ---
+# 戻り値は (キー列, 失敗の説明 or None)
+
+def prop_binary(rng, name):
+    # a op b = は backend の二項演算と同じ表示になる
+    backend = get_backend(name)
+    a, b, op = number_text(rng), number_text(rng), rng.choice(OPERATOR_KEYS)
+    keys = [*a, op, *b, "="]
+    want = expected(backend, lambda: backend.binary(op, backend.number(a), backend.number(b)))
+    got = run(name, keys).display
+    return keys, None if got == want else f"{got} != {want}"
+
+
+def prop_left_to_right(rng, name):
+    # a op1 b op2 c = は左から順に計算する（電卓なので * も + も同じ強さ）
+    backend = get_backend(name)
+    a, b, c = number_text(rng), number_text(rng), number_text(rng)
+    op1, op2 = rng.choice(OPERATOR_KEYS), rng.choice(OPERATOR_KEYS)
+    keys = [*a, op1, *b, op2, *c, "="]
+    try:
+        first = backend.binary(op1, backend.number(a), backend.number(b))
+    except (ArithmeticError, ValueError):
+        return keys, None  # 途中でエラーなら次のキーで AC になるので比べない
+    want = expected(backend, lambda: backend.binary(op2, first, backend.number(c)))
+    got = run(name, keys).display
+    return keys, None if got == want else f"{got} != {want}"
+
+
+def prop_function_key(rng, name):
+    # a SIN などは backend の関数と同じ表示になる（メモした結果もメモなしの計算と同じ）
+    backend = get_backend(name)
+    a, key = number_text(rng), rng.choice(list(KEY_FUNCTIONS))
+    keys = [*a, key, key] if rng.random() < 0.3 else [*a, key]
+    value = backend.number(a)
+    want = expected(backend, lambda: backend.unary(KEY_FUNCTIONS[key], value))
+    if len(keys) - len(a) == 2 and want != ERROR:
+        value = backend.unary(KEY_FUNCTIONS[key], value)
+        want = expected(backend, lambda: backend.unary(KEY_FUNCTIONS[key], value))
+    got = run(name, keys).display
+    return keys, None if got == want else f"{got} != {want}"
+
+
+def prop_matches_expression(rng, name):
+    # float のときは式エンジン（calc_core.expr）で同じ式を計算したのと同じになる
+    if name != "float":
+        return [], None
+    backend = get_backend(name)
+    a, b, op = number_text(rng), number_text(rng), rng.choice(OPERATOR_KEYS)
+    keys = [*a, op, *b, "="]
+    try:
+        want = backend.format(evaluate(f"{a} {op} {b}"))
+    except CalcError:
+        want = ERROR
+    got = run(name, keys).display
+    return keys, None if got == want else f"{got} != {want}"
+
+
+def prop_exact(rng, name):
+    # decimal / fraction では小数2桁までの + - * は正確（お金の計算）。fraction では a / b * b = a
+    if name == "float":
+        return [], None
+    a, b, c = number_text(rng), number_text(rng), number_text(rng)
+    op1, op2 = rng.choice("+-*"), rng.choice("+-*")
+    keys = [*a, op1, *b, op2, *c, "="]
+    exact = get_backend("fraction")
+    want = exact.format(exact.binary(op2, exact.binary(op1, exact.number(a), exact.number(b)), exact.number(c)))
+    got = run(name, keys).display
+    if got != want:
+        return keys, f"{got} != {want}"
+    if name == "fraction" and float(b) != 0:
+        keys = [*a, "/", *b, "*", *b, "="]
+        got = run(name, keys).display
+        if got != exact.format(exact.number(a)):
+            return keys, f"{got} != {a}"
+    return keys, None
+
+
+# --- 性質（でたらめなキー列） ---
+# 戻り値は失敗の説明 or None。失敗したキー列は短くしてから出す
+
+def check_no_crash(name, keys):
+    # どんなキー列でも例外にならず、「=」の後の表示は Error か、読み直すと同じ表示になる数
+    try:
+        calc = run(name, keys + ["="])
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    if calc.display != ERROR and calc.backend.format(calc.backend.number(calc.display)) != calc.display:
+        return f"表示 {calc.display!r} を読み直すと変わる"
+    return None
+
+
+def check_replay(name, keys):
+    # テープを計算し直すと、記録したときと同じ結果になる
+    calc = run(name, keys)
+    show = lambda v: ERROR if v is None else calc.backend.format(v)
+    recorded = [show(e.result) for e in calc.tape]
+    replayed = [show(v) for v in calc.tape.replay()]
+    if recorded != replayed:
+        i = next(i for i, (x, y) in enumerate(zip(recorded, replayed)) if x != y)
+        return f"{i}番目: 記録 {recorded[i]} / 計算し直し {replayed[i]}"
+    return None
+
+
+def check_clear(name, keys):
+    # AC の後は、何を押した後でも最初から計算したのと同じになる
+    tail = ["1", "2", "+", "3", "="]
+    got = run(name, keys + [CLEAR] + tail).display
+    want = run(name, tail).display
+    return None if got == want else f"{got} != {want}"
+
+
+def prop_overflow(rng, name):
+    # float で桁あふれ（inf）になる計算は Error。calc_core.batch でもエラーの要素になる
+    if name != "float":
+        return [], None
+    a = "9" * rng.randint(155, 200)  # 1e155 以上なので2乗すると inf
+    keys = [*a, "x²"] if rng.random() < 0.5 else [*a, "*", *a, "="]
+    got = run(name, keys).display
+    if got != ERROR:
+        return keys, f"{got} != {ERROR}"
+    if batch is not None and not batch.evaluate_columns("a * a", {"a": [float(a)]}).error[0]:
+        return keys, "calc_core.batch ではエラーになりません"
+    return keys, None
+
+
+PROPERTIES = [prop_binary, prop_left_to_right, prop_function_key, prop_matches_expression, prop_exact,
+              prop_overflow]
+CHECKS = [check_no_crash, check_replay, check_clear]
+
+
+def shrink(check, name, keys):
+    # キーを1つずつ抜いてもまだ失敗するなら抜く。これ以上抜けなくなるまで繰り返す
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(keys)):
+            smaller = keys[:i] + keys[i + 1:]
+            if check(name, smaller):
+                keys = smaller
+                changed = True
+                break
+    return keys, check(name, keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="電卓の性質をでたらめな入力で確かめる（画面なし）")
+    parser.add_argument("--examples", type=int, default=EXAMPLES, help="性質ごとに試す数")
+    parser.add_argument("--numeric", default=",".join(BACKENDS), help="数の種類（カンマ区切り）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    failures = 0
+    for name in args.numeric.split(","):
+        for prop in PROPERTIES:
+            rng = random.Random(args.seed)
+            for _ in range(args.examples):
+                keys, message = prop(rng, name)
+                if message:
+                    print(f"❌ {prop.__name__} ({name}): {' '.join(keys)}  → {message}")
+                    failures += 1
+                    break
+            else:
+                print(f"✅ {prop.__name__} ({name})")
+        for check in CHECKS:
+            rng = random.Random(args.seed)
+            for _ in range(args.examples):
+                keys = random_keys(rng)
+                if check(name, keys):
+                    keys, message = shrink(check, name, keys)
+                    print(f"❌ {check.__name__} ({name}): {' '.join(keys)}  → {message}")
+                    failures += 1
+                    break
+            else:
+                print(f"✅ {check.__name__} ({name})")
+    print(f"seed={args.seed} / {args.examples}通りずつ / 失敗 {failures}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
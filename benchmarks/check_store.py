@@ -0,0 +1,71 @@
+# 保存（weather_core.store）の「同じ発表・同じ内容なら保存しない」を確かめる（ネットワークには出ない）
+# 使い方:
+#   python benchmarks/check_store.py
+# 保存は間をあけずに続けて行う（同じ秒の保存も別の取得として残ること）。成り立たなければ終了コード1
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from weather_core import store
+
+REPORT = "2026-10-18T11:00:00+09:00"
+ROWS = [
+    ("2026-10-18", "晴れ", 22, 14, 10, "100"),
+    ("2026-10-19", "くもり", 20, 13, 30, "200"),
+]
+
+
+def count(db, sql, *params):
+    with db.lock:
+        return db.conn.execute(sql, params).fetchone()[0]
+
+
+def main():
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"{'✅' if ok else '❌'} {name}{('  ' + detail) if detail and not ok else ''}")
+        if not ok:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = store.WeatherStore(str(Path(tmp) / "check.db"))
+        db.init_db()
+        first = db.save_forecasts_many({"130010": ROWS}, reports={"130010": REPORT})
+        check("1回目は保存する", first == (len(ROWS), 0), f"{first}")
+
+        second = db.save_forecasts_many({"130010": ROWS}, reports={"130010": REPORT})
+        check("同じ発表・同じ内容の2回目は保存しない（inserted == 0）", second[0] == 0, f"{second}")
+        snapshots = count(db, "SELECT COUNT(*) FROM snapshots WHERE region_code = ?", "130010")
+        check("スナップショットは1つ", snapshots == 1, f"{snapshots}")
+        fetched = count(db, "SELECT COUNT(DISTINCT fetched_at) FROM forecasts WHERE region_code = ?", "130010")
+        check("履歴（取得時刻）は1つ", fetched == 1, f"{fetched}")
+
+        changed = [ROWS[0], ("2026-10-19", "雨", 18, 12, 80, "300")]
+        third = db.save_forecasts_many({"130010": changed}, reports={"130010": REPORT})
+        check("内容が変われば保存する", third == (len(changed), 0), f"{third}")
+        # 直後にもう一度変わった内容を保存しても飛ばされず、新しい内容のハッシュで比べる
+        again = [ROWS[0], ("2026-10-19", "晴れ", 21, 12, 0, "100")]
+        fourth = db.save_forecasts_many({"130010": again}, reports={"130010": REPORT})
+        check("同じ秒に内容が変わっても保存する", fourth == (len(again), 0), f"{fourth}")
+        fifth = db.save_forecasts_many({"130010": again}, reports={"130010": REPORT})
+        check("その直後の同じ内容は保存しない", fifth[0] == 0, f"{fifth}")
+        latest = db.get_forecasts("130010")
+        check("最新のスナップショットは最後に保存した内容", [f.weather for f in latest] == ["晴れ", "晴れ"],
+              f"{latest}")
+
+        sixth = db.save_forecasts_many({"130010": again}, reports={"130010": "2026-10-18T17:00:00+09:00"})
+        check("発表時刻が変われば保存する", sixth == (len(again), 0), f"{sixth}")
+        snapshots = count(db, "SELECT COUNT(*) FROM snapshots WHERE region_code = ?", "130010")
+        check("スナップショットは4つ", snapshots == 4, f"{snapshots}")
+        fetched = count(db, "SELECT COUNT(DISTINCT fetched_at) FROM forecasts WHERE region_code = ?", "130010")
+        check("保存した取得時刻は4つ", fetched == 4, f"{fetched}")
+        db.close()
+
+    print(f"失敗 {len(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
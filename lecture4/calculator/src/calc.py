@@ -1,5 +1,7 @@
 import flet as ft
-import math #高度な計算したい
+from calc_core.machine import Calculator #計算は Flet なしでも使える calc_core に任せる
+from calc_core.numeric import BACKENDS
+from calc_core.tape import DB_PATH #計算の履歴（calc_history.db に保存する）
 
 
 class CalcButton(ft.ElevatedButton):
@@ -33,18 +35,27 @@ class ExtraActionButton(CalcButton):
 
 
 class CalculatorApp(ft.Container):
-    def __init__(self):
+    def __init__(self, numeric=None, precision=None):
+        # numeric: "float" / "decimal" / "fraction"（省くと環境変数 CALC_NUMERIC、既定は float）
         super().__init__()
-        self.reset()
-
-        self.result = ft.Text(value="0", color=ft.Colors.WHITE, size=20)
+        self.core = Calculator(numeric, precision, history_db=DB_PATH)
+
+        self.result = ft.Text(value=self.core.display, color=ft.Colors.WHITE, size=20)
+        self.numeric = ft.Dropdown(
+            value=self.core.backend.name,
+            options=[ft.dropdown.Option(name) for name in BACKENDS],
+            on_change=self.on_backend_change,
+            width=140,
+            text_size=12,
+            color=ft.Colors.WHITE,
+        )
         self.width = 1000
         self.bgcolor = ft.Colors.BLACK
         self.border_radius = ft.border_radius.all(20)
         self.padding = 20
         self.content = ft.Column(
             controls=[
-                ft.Row(controls=[self.result], alignment="end"),
+                ft.Row(controls=[self.numeric, self.result], alignment="spaceBetween"),
                 ft.Row(
                     controls=[   
                         ExtraActionButton(text="AC", button_clicked=self.button_clicked),
@@ -93,112 +104,23 @@ class CalculatorApp(ft.Container):
         )
 
     def button_clicked(self, e):
-        data = e.control.data
-        print(f"Button clicked with data = {data}")
-        if self.result.value == "Error" or data == "AC":
-            self.result.value = "0"
-            self.reset()
-
-        elif data in ("1", "2", "3", "4", "5", "6", "7", "8", "9", "0", "."):
-            if self.result.value == "0" or self.new_operand == True:
-                self.result.value = data
-                self.new_operand = False
-            else:
-                self.result.value = self.result.value + data
-
-        elif data in ("+", "-", "*", "/"):
-            self.result.value = self.calculate(self.operand1, float(self.result.value), self.operator)
-            self.operator = data
-            if self.result.value == "Error":
-                self.operand1 = "0"
-            else:
-                self.operand1 = float(self.result.value)
-            self.new_operand = True
-
-        elif data in ("="):
-            self.result.value = self.calculate(self.operand1, float(self.result.value), self.operator)
-            self.reset()
-
-        elif data in ("%"):
-            self.result.value = float(self.result.value) / 100
-            self.reset()
-
-        elif data in ("+/-"):
-            if float(self.result.value) > 0:
-                self.result.value = "-" + str(self.result.value)
-
-            elif float(self.result.value) < 0:
-                self.result.value = str(self.format_number(abs(float(self.result.value))))
-        elif data == "SIN":
-            try:
-                value = float(self.result.value)
-                res = math.sin(math.radians(value)) 
-                self.result.value = self.format_number(res)
-                self.new_operand = True
-            except ValueError:
-                self.result.value = "Error"
-        elif data == "COS":
-            try:
-                value = float(self.result.value)
-                res = math.cos(math.radians(value)) 
-                self.result.value = self.format_number(res)
-                self.new_operand = True
-            except ValueError:
-                self.result.value = "Error"
-        elif data == "TAN":
-            try:
-                value = float(self.result.value)
-                res = math.tan(math.radians(value)) 
-                self.result.value = self.format_number(res)
-                self.new_operand = True
-            except ValueError:
-                self.result.value = "Error"    
-        elif data == "√":
-            try:
-                value = float(self.result.value)
-                res = math.sqrt(value)
-                self.result.value = self.format_number(res)
-                self.new_operand = True
-            except ValueError:
-                self.result.value = "Error"
-        elif data == "x²":
-            try:
-                value = float(self.result.value)
-                res = value ** 2
-                self.result.value = self.format_number(res)
-                self.new_operand = True
-            except ValueError:
-                self.result.value = "Error"
-    
+        # 計算は Calculator（calc_core.machine）がキーの文字列だけで行い、ここでは表示を更新するだけ
+        self.result.value = self.core.press(e.control.data)
+        self.show_save_error()
         self.update()
 
-    def format_number(self, num):
-        if num % 1 == 0:
-            return int(num)
-        else:
-            return num
-
-    def calculate(self, operand1, operand2, operator):
-
-        if operator == "+":
-            return self.format_number(operand1 + operand2)
-
-        elif operator == "-":
-            return self.format_number(operand1 - operand2)
-
-        elif operator == "*":
-            return self.format_number(operand1 * operand2)
-
-        elif operator == "/":
-            if operand2 == 0:
-                return "Error"
-            else:
-                return self.format_number(operand1 / operand2)
+    def on_backend_change(self, e):
+        self.core.set_backend(e.control.value)
+        self.result.value = self.core.display
+        self.show_save_error()
+        self.update()
 
-    def reset(self):
-        self.operator = "+"
-        self.operand1 = 0
-        self.new_operand = True
+    def show_save_error(self):
+        # 履歴を保存できなかったときだけ知らせる（計算の結果はそのまま使える）
+        if self.core.save_error is not None:
+            self.page.snack_bar = ft.SnackBar(ft.Text(f"⚠️ 履歴を保存できませんでした: {self.core.save_error}"))
+            self.page.snack_bar.open = True
+            self.page.update()
 
 
 def main(page: ft.Page):
@@ -207,7 +129,8 @@ def main(page: ft.Page):
     page.add(calc)
 
 
-ft.app(main)
+if __name__ == "__main__":
+    ft.app(main)
 
 #参考文献
 #1. 'https://flet.dev/docs/tutorials/python-calculator/','Create Calculator app in Python with Flet',(参照日:2025/12/14),
@@ -0,0 +1 @@
+# 電卓の計算部分（Flet なしで使える）。画面は calc.py
@@ -0,0 +1,51 @@
+# 画面なしで式を計算する（src フォルダで実行する）
+#   python -m calc_core "2 * sin(x) + 1" x=30      1つの式を計算する
+#   python -m calc_core -f formulas.txt x=1 y=2    1行に1つずつ書いた式をまとめて計算する（- なら標準入力）
+import argparse
+import sys
+
+from calc_core.expr import CalcError, compile_expression, format_number
+
+
+def parse_bindings(items):
+    env = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"変数は 名前=値 で指定してください: {item}")
+        env[name.strip()] = float(value)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m calc_core")
+    parser.add_argument("expression", nargs="?", help="計算する式")
+    parser.add_argument("bindings", nargs="*", help="変数の値（x=1 のように書く）")
+    parser.add_argument("-f", "--file", help="式を1行に1つ書いたファイル（- なら標準入力）")
+    args = parser.parse_args()
+
+    bindings = list(args.bindings)
+    if args.file:
+        # -f のときは1つ目の位置引数も変数の指定として扱う
+        if args.expression:
+            bindings.insert(0, args.expression)
+        source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        formulas = [line.strip() for line in source if line.strip()]
+    elif args.expression:
+        formulas = [args.expression]
+    else:
+        parser.error("式か -f を指定してください")
+    env = parse_bindings(bindings)
+
+    failed = 0
+    for formula in formulas:
+        try:
+            print(format_number(compile_expression(formula).evaluate(env)))
+        except CalcError as e:
+            print(f"Error: {e}")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
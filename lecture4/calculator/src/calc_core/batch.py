@@ -0,0 +1,237 @@
+# 電卓の演算（SIN / COS / TAN / √ / x² と四則演算）を配列にまとめて適用する
+#   r = apply("sin", values)                 1つの演算を配列全体に
+#   r = evaluate_columns("sqrt(a) / b", {"a": a, "b": b})   式（calc_core.expr の書き方）を列ごとに
+#   r.values  結果（エラーの要素は NaN）
+#   r.error   エラーになった要素の真偽マスク（電卓なら "Error" と表示するもの）
+# 要素ごとの Python ループは使わず、NumPy の ufunc で計算する
+#   python -m calc_core.batch "sin(x)" data.csv -o out.csv
+#   python -m calc_core.batch sqrt values.npy -o out.npz
+# numpy が必要（pyproject.toml の extra "batch"）。電卓アプリ本体は numpy なしで動く
+import argparse
+import sys
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("calc_core.batch には numpy が必要です（pip install numpy）") from e
+
+from calc_core.expr import CalcError, Binary, Call, Num, Unary, Var, parse
+
+
+class BatchResult(NamedTuple):
+    values: np.ndarray
+    error: np.ndarray
+
+
+# --- 演算の表（calc_core.expr の BINARY_OPS / UNARY_OPS / FUNCTIONS と同じ名前） ---
+# 戻り値は (値, エラーのマスク)。マスクは定義域の外（√ に負の数、0 で割る など）を表す
+# 三角関数は電卓のボタンと同じく度（degree）で計算する
+
+def _sqrt(x):
+    return np.sqrt(x), x < 0
+
+
+def _divide(x, y):
+    return np.divide(x, y), y == 0
+
+
+def _power(x, y):
+    # 負の数の分数乗は電卓でもエラーにする
+    return np.power(x, y), (x < 0) & (np.floor(y) != y)
+
+
+def _plain(func):
+    # 定義域の制限がない演算
+    def apply(*args):
+        return func(*args), False
+    return apply
+
+
+ARRAY_BINARY_OPS = {
+    "+": _plain(np.add),
+    "-": _plain(np.subtract),
+    "*": _plain(np.multiply),
+    "/": _divide,
+    "^": _power,
+}
+ARRAY_UNARY_OPS = {
+    "-": _plain(np.negative),
+    "+": _plain(np.positive),
+    "√": _sqrt,
+    "²": _plain(np.square),
+    "%": _plain(lambda x: x / 100),
+}
+ARRAY_FUNCTIONS = {
+    "sin": _plain(lambda x: np.sin(np.radians(x))),
+    "cos": _plain(lambda x: np.cos(np.radians(x))),
+    "tan": _plain(lambda x: np.tan(np.radians(x))),
+    "sqrt": _sqrt,
+    "sq": _plain(np.square),
+    "abs": _plain(np.abs),
+    "min": _plain(np.minimum),
+    "max": _plain(np.maximum),
+}
+
+
+def _finish(values, error):
+    # 桁あふれ（inf）や NaN もエラーにそろえ、エラーの要素は NaN にする
+    values = np.asarray(values, dtype=np.float64)
+    error = np.asarray(error, dtype=bool) | ~np.isfinite(values)
+    error = np.broadcast_to(error, values.shape)
+    if error.any():
+        values = np.where(error, np.nan, values)
+    return BatchResult(values, error.copy())
+
+
+def apply(op, x, y=None):
+    # 1つの演算（関数名・単項／二項の記号）を配列に適用する
+    x = np.asarray(x, dtype=np.float64)
+    with np.errstate(all="ignore"):
+        if y is not None:
+            if op not in ARRAY_BINARY_OPS:
+                raise CalcError(f"知らない二項演算です: {op}")
+            values, error = ARRAY_BINARY_OPS[op](x, np.asarray(y, dtype=np.float64))
+        elif op in ARRAY_FUNCTIONS:
+            values, error = ARRAY_FUNCTIONS[op](x)
+        elif op in ARRAY_UNARY_OPS:
+            values, error = ARRAY_UNARY_OPS[op](x)
+        else:
+            raise CalcError(f"知らない演算です: {op}")
+    return _finish(values, error)
+
+
+def compile_tree(tree):
+    # AST を「列の dict → (値, エラーのマスク)」の関数にする。途中でエラーになった要素のマスクは上へ伝える
+    if isinstance(tree, Num):
+        value = tree.value
+        return lambda columns: (value, False)
+    if isinstance(tree, Var):
+        name = tree.name
+        return lambda columns: (columns[name], False)
+    if isinstance(tree, Unary):
+        func = ARRAY_UNARY_OPS[tree.op]
+        operand = compile_tree(tree.operand)
+
+        def unary(columns):
+            x, x_error = operand(columns)
+            values, error = func(x)
+            return values, x_error | error
+        return unary
+    if isinstance(tree, Binary):
+        func = ARRAY_BINARY_OPS[tree.op]
+        left = compile_tree(tree.left)
+        right = compile_tree(tree.right)
+
+        def binary(columns):
+            x, x_error = left(columns)
+            y, y_error = right(columns)
+            values, error = func(x, y)
+            return values, x_error | y_error | error
+        return binary
+    if isinstance(tree, Call):
+        func = ARRAY_FUNCTIONS[tree.name]
+        args = [compile_tree(a) for a in tree.args]
+
+        def call(columns):
+            results = [arg(columns) for arg in args]
+            values, error = func(*(v for v, _ in results))
+            for _, arg_error in results:
+                error = error | arg_error
+            return values, error
+        return call
+    raise CalcError(f"計算できない式です: {tree!r}")
+
+
+def evaluate_columns(source, columns):
+    # 式を列（変数名 → 配列）に対して一度に評価する
+    func = compile_tree(parse(source))
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    try:
+        with np.errstate(all="ignore"):
+            values, error = func(columns)
+    except KeyError as e:
+        raise CalcError(f"列 {e.args[0]} がありません") from None
+    if not columns:
+        values = np.asarray(values, dtype=np.float64)
+    return _finish(values, error)
+
+
+def format_results(result):
+    # 表示用の文字列の配列。整数になる値は整数で、エラーは "Error"（電卓の表示と同じ）
+    text = np.char.mod("%.15g", np.where(result.error, 0.0, result.values))
+    return np.where(result.error, "Error", text)
+
+
+# --- コマンドライン ---
+
+def _read_csv(path):
+    # 1行目が数値でなければ列名とみなす。列名がないときは x, x1, x2, ... と呼ぶ
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with source:
+        first = source.readline()
+        cells = [c.strip() for c in first.split(",")]
+        try:
+            [float(c) for c in cells]
+        except ValueError:
+            names = cells
+            data = np.loadtxt(source, delimiter=",", ndmin=2, dtype=np.float64)
+        else:
+            names = ["x"] + [f"x{i}" for i in range(1, len(cells))]
+            data = np.loadtxt([first] + list(source), delimiter=",", ndmin=2, dtype=np.float64)
+    if data.size == 0:
+        data = np.empty((0, len(names)))
+    return names, {name: data[:, i] for i, name in enumerate(names)}
+
+
+def read_columns(path):
+    # .npy は1次元なら x、2次元なら x, x1, ...。.npz は中の配列名をそのまま使う。それ以外は CSV
+    if path.endswith(".npy"):
+        data = np.load(path)
+        if data.ndim == 1:
+            return ["x"], {"x": data}
+        names = ["x"] + [f"x{i}" for i in range(1, data.shape[1])]
+        return names, {name: data[:, i] for i, name in enumerate(names)}
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return list(data.files), {name: data[name] for name in data.files}
+    return _read_csv(path)
+
+
+def write_result(path, names, columns, result):
+    if path.endswith(".npy"):
+        np.save(path, result.values)
+    elif path.endswith(".npz"):
+        np.savez(path, values=result.values, error=result.error)
+    else:
+        # CSV は元の列の後ろに result 列を足す
+        out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        table = np.column_stack([np.char.mod("%.15g", columns[n]) for n in names] + [format_results(result)])
+        np.savetxt(out, table, fmt="%s", delimiter=",", header=",".join(names + ["result"]), comments="")
+        if out is not sys.stdout:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m calc_core.batch")
+    parser.add_argument("expression", help="式（sin(x) など）か演算名（sin / cos / tan / sqrt / sq）")
+    parser.add_argument("input", help="CSV / .npy / .npz（- なら CSV を標準入力から）")
+    parser.add_argument("-o", "--output", default="-", help="CSV / .npy / .npz（既定は CSV を標準出力へ）")
+    args = parser.parse_args()
+
+    names, columns = read_columns(args.input)
+    # 演算名だけなら1列目に適用する
+    source = f"{args.expression}({names[0]})" if args.expression in ARRAY_FUNCTIONS else args.expression
+    try:
+        result = evaluate_columns(source, columns)
+    except CalcError as e:
+        raise SystemExit(f"Error: {e}")
+    write_result(args.output, names, columns, result)
+    errors = int(result.error.sum())
+    if errors:
+        print(f"{errors} 件がエラーになりました", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# 画面なしで電卓のキーを押す（src フォルダで実行する）
+#   python -m calc_core.driver keys.txt            1行ごとに最後の表示を出す（- なら標準入力）
+#   python -m calc_core.driver keys.txt --steps    キーごとの表示も出す
+# キーのファイルは1行に1つの操作列。キーは空白で区切り、数字の並び（12.5 など）は1文字ずつ押す
+#   12 + 3.5 =
+#   9 √ x² AC
+#   # から後ろはコメント
+# 行ごとに AC から始める
+import argparse
+import sys
+
+from calc_core.machine import CLEAR, DIGIT_KEYS, KEYS, Calculator
+from calc_core.numeric import BACKENDS
+
+
+def split_keys(line):
+    # 1行をキーのリストにする
+    keys = []
+    for token in line.split("#", 1)[0].split():
+        if token in KEYS:
+            keys.append(token)
+        elif all(c in DIGIT_KEYS for c in token):
+            keys.extend(token)
+        else:
+            raise ValueError(f"知らないキーです: {token!r}")
+    return keys
+
+
+def read_sequences(lines):
+    # [(行番号, キーのリスト)]。空行とコメントだけの行は飛ばす
+    sequences = []
+    for number, line in enumerate(lines, 1):
+        try:
+            keys = split_keys(line)
+        except ValueError as e:
+            raise ValueError(f"{number}行目: {e}") from None
+        if keys:
+            sequences.append((number, keys))
+    return sequences
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m calc_core.driver")
+    parser.add_argument("file", help="キーを書いたファイル（- なら標準入力）")
+    parser.add_argument("--numeric", choices=list(BACKENDS), help="数の種類（既定は環境変数 CALC_NUMERIC か float）")
+    parser.add_argument("--precision", type=int)
+    parser.add_argument("--steps", action="store_true", help="キーごとの表示も出す")
+    parser.add_argument("--trace", action="store_true", help="押したキーを出す（CALC_TRACE=1 と同じ）")
+    parser.add_argument("--history", help="履歴テープを保存する SQLite のファイル")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    with source:
+        try:
+            sequences = read_sequences(source)
+        except ValueError as e:
+            raise SystemExit(f"Error: {e}")
+
+    calc = Calculator(args.numeric, args.precision, history_db=args.history, trace=args.trace or None)
+    errors = 0
+    for number, keys in sequences:
+        calc.press(CLEAR)
+        if args.steps:
+            for key in keys:
+                print(f"{number}: {key}\t{calc.press(key)}")
+        else:
+            print(calc.feed(keys))
+        errors += calc.display == "Error"
+    error = calc.save_tape()
+    if error is not None:
+        print(f"履歴を保存できませんでした: {error}", file=sys.stderr)
+        return 1
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
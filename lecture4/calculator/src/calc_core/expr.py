@@ -0,0 +1,326 @@
+# 電卓の式エンジン
+#   字句解析 → Pratt パーサーで AST → 入れ子のクロージャにコンパイルして、変数を変えて何度でも評価する
+#   f = compile_expression("2 * sin(x) + y^2")
+#   f(x=30, y=3)          → 10.0
+#   f.evaluate({"x": 90, "y": 0})
+# 三角関数は電卓のボタンと同じく度（degree）で計算する
+import math
+import operator
+import re
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+
+class CalcError(ValueError):
+    # 式が読めない・計算できない（0で割った、√ に負の数など）。電卓では "Error" と表示する
+    def __init__(self, message, position=None):
+        super().__init__(message if position is None else f"{message}（{position + 1}文字目）")
+        self.position = position
+
+
+# --- 字句解析 ---
+
+class Token(NamedTuple):
+    kind: str  # "number" / "name" / "op" / "end"
+    value: str
+    position: int
+
+
+TOKEN_RE = re.compile(r"""
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+      | (?P<op>\*\*|[-+*/^%(),√²×÷])
+    """, re.VERBOSE)
+# 電卓の記号を式の記号にそろえる
+ALIASES = {"×": "*", "÷": "/", "**": "^"}
+
+
+def tokenize(source):
+    tokens = []
+    pos = 0
+    while True:
+        while pos < len(source) and source[pos].isspace():
+            pos += 1
+        if pos >= len(source):
+            break
+        m = TOKEN_RE.match(source, pos)
+        if not m:
+            raise CalcError(f"読めない文字があります: {source[pos]!r}", pos)
+        kind = m.lastgroup
+        value = m.group(kind)
+        tokens.append(Token(kind, ALIASES.get(value, value), pos))
+        pos = m.end()
+    tokens.append(Token("end", "", len(source)))
+    return tokens
+
+
+# --- AST ---
+
+class Num(NamedTuple):
+    value: float
+
+
+class Var(NamedTuple):
+    name: str
+
+
+class Unary(NamedTuple):
+    op: str
+    operand: tuple
+
+
+class Binary(NamedTuple):
+    op: str
+    left: tuple
+    right: tuple
+
+
+class Call(NamedTuple):
+    name: str
+    args: Tuple[tuple, ...]
+
+
+# --- 演算の表（演算子・関数ごとの if/elif を並べずに表で引く） ---
+
+def _sqrt(x):
+    return math.sqrt(x)
+
+
+def _power(x, y):
+    result = x ** y
+    if isinstance(result, complex):
+        raise ValueError("負の数の分数乗は計算できません")
+    return result
+
+
+def _percent(x):
+    return x / 100
+
+
+BINARY_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "^": _power,
+}
+UNARY_OPS = {
+    "-": operator.neg,
+    "+": operator.pos,
+    "√": _sqrt,
+    "²": lambda x: x * x,
+    "%": _percent,
+}
+# 名前: (引数の数, 関数)
+FUNCTIONS = {
+    "sin": (1, lambda x: math.sin(math.radians(x))),
+    "cos": (1, lambda x: math.cos(math.radians(x))),
+    "tan": (1, lambda x: math.tan(math.radians(x))),
+    "sqrt": (1, _sqrt),
+    "sq": (1, lambda x: x * x),
+    "abs": (1, abs),
+    "min": (2, min),
+    "max": (2, max),
+}
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+# 二項演算子の強さと結合の向き。前置の - / √ は掛け算より強く、^ より弱い（-2^2 = -4）
+BINARY_POWER = {"+": 10, "-": 10, "*": 20, "/": 20, "^": 40}
+RIGHT_ASSOC = {"^"}
+PREFIX_POWER = 30
+POSTFIX = {"²", "%"}
+
+
+# --- 構文解析（Pratt パーサー） ---
+
+class Parser:
+    def __init__(self, source):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, value):
+        token = self.next()
+        if token.value != value:
+            raise CalcError(f"{value!r} がありません", token.position)
+        return token
+
+    def parse(self):
+        tree = self.expression(0)
+        token = self.peek()
+        if token.kind != "end":
+            raise CalcError(f"余分な {token.value!r} があります", token.position)
+        return tree
+
+    def expression(self, min_power):
+        left = self.prefix()
+        while True:
+            token = self.peek()
+            if token.kind != "op":
+                break
+            if token.value in POSTFIX:
+                self.next()
+                left = Unary(token.value, left)
+                continue
+            power = BINARY_POWER.get(token.value)
+            if power is None or power < min_power or (power == min_power and token.value not in RIGHT_ASSOC):
+                break
+            self.next()
+            right = self.expression(power if token.value in RIGHT_ASSOC else power + 1)
+            left = Binary(token.value, left, right)
+        return left
+
+    def prefix(self):
+        token = self.next()
+        if token.kind == "number":
+            return Num(float(token.value))
+        if token.kind == "name":
+            if self.peek().value == "(":
+                return self.call(token)
+            if token.value in CONSTANTS:
+                return Num(CONSTANTS[token.value])
+            if token.value in FUNCTIONS:
+                raise CalcError(f"{token.value} の後に ( がありません", token.position)
+            return Var(token.value)
+        if token.value == "(":
+            tree = self.expression(0)
+            self.expect(")")
+            return tree
+        if token.value in ("-", "+", "√"):
+            return Unary(token.value, self.expression(PREFIX_POWER))
+        if token.kind == "end":
+            raise CalcError("式が途中で終わっています", token.position)
+        raise CalcError(f"ここに {token.value!r} は書けません", token.position)
+
+    def call(self, name_token):
+        if name_token.value not in FUNCTIONS:
+            raise CalcError(f"知らない関数です: {name_token.value}", name_token.position)
+        self.expect("(")
+        args = [self.expression(0)]
+        while self.peek().value == ",":
+            self.next()
+            args.append(self.expression(0))
+        self.expect(")")
+        arity = FUNCTIONS[name_token.value][0]
+        if len(args) != arity:
+            raise CalcError(f"{name_token.value} の引数は {arity} 個です", name_token.position)
+        return Call(name_token.value, tuple(args))
+
+
+def parse(source):
+    return Parser(source).parse()
+
+
+def variables(tree):
+    # 式に出てくる変数名
+    if isinstance(tree, Var):
+        return {tree.name}
+    if isinstance(tree, Num):
+        return set()
+    if isinstance(tree, Call):
+        return set().union(*(variables(a) for a in tree.args))
+    if isinstance(tree, Unary):
+        return variables(tree.operand)
+    return variables(tree.left) | variables(tree.right)
+
+
+# --- コンパイル ---
+
+def _fold(func, *values):
+    # 定数どうしの計算はコンパイル時に済ませる。計算できない（0で割るなど）ときは評価時にエラーにする
+    try:
+        return Num(func(*values))
+    except (ArithmeticError, ValueError):
+        return None
+
+
+def compile_tree(tree):
+    # AST を env（変数名 → 値の dict）を受け取る関数にする。評価のたびに木をたどらない
+    if isinstance(tree, Num):
+        value = tree.value
+        return lambda env: value
+    if isinstance(tree, Var):
+        name = tree.name
+        return lambda env: env[name]
+    if isinstance(tree, Unary):
+        func = UNARY_OPS[tree.op]
+        if isinstance(tree.operand, Num):
+            folded = _fold(func, tree.operand.value)
+            if folded:
+                return compile_tree(folded)
+        operand = compile_tree(tree.operand)
+        return lambda env: func(operand(env))
+    if isinstance(tree, Binary):
+        func = BINARY_OPS[tree.op]
+        if isinstance(tree.left, Num) and isinstance(tree.right, Num):
+            folded = _fold(func, tree.left.value, tree.right.value)
+            if folded:
+                return compile_tree(folded)
+        left = compile_tree(tree.left)
+        right = compile_tree(tree.right)
+        return lambda env: func(left(env), right(env))
+    _, func = FUNCTIONS[tree.name]
+    if all(isinstance(a, Num) for a in tree.args):
+        folded = _fold(func, *(a.value for a in tree.args))
+        if folded:
+            return compile_tree(folded)
+    args = [compile_tree(a) for a in tree.args]
+    if len(args) == 1:
+        arg = args[0]
+        return lambda env: func(arg(env))
+    first, second = args
+    return lambda env: func(first(env), second(env))
+
+
+class Expression:
+    # パース・コンパイル済みの式。同じ式を変数だけ変えて何度も評価するときに使う
+    __slots__ = ("source", "tree", "variables", "_func")
+
+    def __init__(self, source):
+        self.source = source
+        self.tree = parse(source)
+        self.variables = tuple(sorted(variables(self.tree)))
+        self._func = compile_tree(self.tree)
+
+    def evaluate(self, env=None):
+        try:
+            result = self._func(env or {})
+            # 桁あふれ（inf）や NaN も電卓・calc_core.batch と同じくエラーにする
+            if isinstance(result, float) and not math.isfinite(result):
+                raise OverflowError("桁あふれです")
+            return result
+        except KeyError as e:
+            raise CalcError(f"変数 {e.args[0]} の値がありません") from None
+        except (ArithmeticError, ValueError) as e:
+            raise CalcError(f"計算できません: {e}") from e
+
+    def __call__(self, **env):
+        return self.evaluate(env)
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
+
+
+# 同じ文字列の式はパース・コンパイルを1回で済ませる
+@lru_cache(maxsize=1024)
+def compile_expression(source):
+    return Expression(source)
+
+
+def evaluate(source, **env):
+    return compile_expression(source).evaluate(env)
+
+
+def format_number(num):
+    # 整数になる値は整数で表示する（電卓の表示と同じ）
+    if isinstance(num, float) and num.is_integer():
+        return int(num)
+    return num
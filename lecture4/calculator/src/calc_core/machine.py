@@ -0,0 +1,160 @@
+# 電卓の状態（入力中の数・演算子・表示）をキーの文字列だけで動かすクラス。Flet なしで使える
+#   calc = Calculator("decimal")
+#   calc.feed(["1", "2", "+", "3", "="])   → "15"（表示の文字列）
+#   calc.press("SIN")
+# 画面（calc.py）はボタンの data をそのまま press() に渡して、display を ft.Text に入れるだけ
+import os
+import sqlite3
+from datetime import datetime
+
+from calc_core.numeric import get_backend
+from calc_core.tape import CLEAR, Tape
+
+DIGIT_KEYS = ("1", "2", "3", "4", "5", "6", "7", "8", "9", "0", ".")
+OPERATOR_KEYS = ("+", "-", "*", "/")
+# ボタン → 式エンジンの関数名
+KEY_FUNCTIONS = {"SIN": "sin", "COS": "cos", "TAN": "tan", "√": "sqrt", "x²": "sq"}
+KEYS = DIGIT_KEYS + OPERATOR_KEYS + ("=", "%", "+/-", CLEAR) + tuple(KEY_FUNCTIONS)
+ERROR = "Error"
+# 1 にするとキーを押すたびに表示する（前の print と同じ）
+TRACE = os.environ.get("CALC_TRACE") == "1"
+
+
+class Calculator:
+    def __init__(self, numeric=None, precision=None, history_db=None, trace=None):
+        # numeric: "float" / "decimal" / "fraction"（省くと環境変数 CALC_NUMERIC、既定は float）
+        # history_db: 「=」のたびに履歴テープを保存する SQLite のファイル（None なら保存しない）
+        self.precision = precision
+        self.history_db = history_db
+        self.trace = TRACE if trace is None else trace
+        self.save_error = None  # 直前のキーで履歴を保存できなかったときの sqlite3.Error
+        self.set_backend(numeric, precision)
+
+    def press(self, key):
+        # キーを1つ押して、表示の文字列を返す
+        if self.trace:
+            print(f"Button clicked with data = {key}")
+        self.save_error = None
+        if self.display == ERROR or key == CLEAR:
+            self.show(self.backend.zero)
+            self.tape.record(CLEAR, None, None, self.value)
+            self.reset(chained=True)
+
+        elif key == "." and not self.new_operand and "." in self.display:
+            # 小数点は1つだけ（2つ目は無視する）
+            pass
+
+        elif key in DIGIT_KEYS:
+            if self.display == "0" or self.new_operand:
+                self.display = "0." if key == "." else key
+                self.new_operand = False
+            else:
+                self.display = self.display + key
+            # 入力中は表示の文字列のまま。数にするのは演算のキーを押したとき（current）
+            self.typing = True
+
+        elif key in OPERATOR_KEYS:
+            self.show(self.calculate(self.operand1, self.current(), self.operator))
+            self.operator = key
+            self.operand1 = self.backend.zero if self.display == ERROR else self.value
+            self.chained = True
+            self.new_operand = True
+
+        elif key == "=":
+            self.show(self.calculate(self.operand1, self.current(), self.operator))
+            self.reset()
+            self.save_tape()
+
+        elif key == "%":
+            self.apply_function("%", "%")
+            self.reset()
+
+        elif key == "+/-":
+            if self.current() != 0:
+                self.apply_function("+/-", "-")
+
+        elif key in KEY_FUNCTIONS:
+            # SIN / COS / TAN / √ / x² は式エンジン（calc_core.expr）と同じ関数を数の種類に合わせて計算する
+            self.apply_function(KEY_FUNCTIONS[key], KEY_FUNCTIONS[key])
+            self.new_operand = True
+
+        else:
+            raise ValueError(f"知らないキーです: {key!r}")
+        return self.display
+
+    def feed(self, keys):
+        # キーを順に押して、最後の表示を返す
+        for key in keys:
+            self.press(key)
+        return self.display
+
+    def current(self):
+        # 表示中の値を数で返す。文字列から読むのは入力中の数字だけで、計算結果は数のまま持っている
+        if self.typing:
+            self.value = self.backend.number(self.display)
+            self.typing = False
+            self.fresh = True
+        return self.value
+
+    def ref(self, value):
+        # テープに書く値。入力した数はそのまま、直前の結果なら None（計算し直すときに前の結果をつなぐ）
+        return value if self.fresh else None
+
+    def apply_function(self, key, name):
+        # 表示中の値に関数を適用する。同じ (関数, 値) の結果は backend が覚えている
+        x = self.current()
+        try:
+            result = self.backend.function(name, x)
+        except (ValueError, ArithmeticError):
+            result = None
+        self.tape.record(key, self.ref(x), None, result)
+        # 直前の結果が変わったので、operand1 はこの後は値のまま記録する
+        self.chained = False
+        self.show(result)
+
+    def show(self, value):
+        # 数を表示する。None はエラー
+        self.typing = False
+        self.fresh = False
+        if value is None:
+            self.display = ERROR
+        else:
+            self.value = value
+            self.display = self.backend.format(value)
+
+    def calculate(self, operand1, operand2, operator):
+        # 四則演算は選んだ数の種類（float / decimal / fraction）で計算する。0で割るなどは None
+        try:
+            result = self.backend.binary(operator, operand1, operand2)
+        except (ArithmeticError, ValueError):
+            result = None
+        self.tape.record(operator, None if self.chained else operand1, self.ref(operand2), result)
+        return result
+
+    def save_tape(self):
+        # まだ保存していない分を書く。保存できなくても電卓は使えるので、失敗は例外にせず返す（成功なら None）
+        # 画面側は press() / set_backend() の後に save_error を見て知らせる。書けなかった分は次の保存で書き直す
+        self.save_error = None
+        if self.history_db is not None:
+            try:
+                self.tape.save(self.session, self.history_db)
+            except sqlite3.Error as e:
+                self.save_error = e
+        return self.save_error
+
+    def set_backend(self, name=None, precision=None):
+        # 数の種類を切り替えたら AC と同じく最初から。履歴は数の種類ごとに別のセッションにする
+        if hasattr(self, "tape"):
+            self.save_tape()
+        self.backend = get_backend(name, precision or self.precision)
+        self.tape = Tape(self.backend)
+        self.session = datetime.now().isoformat(timespec="milliseconds")
+        self.show(self.backend.zero)
+        self.reset(chained=True)
+
+    def reset(self, chained=False):
+        # chained: operand1 の 0 を「開始値」として扱う（AC の直後）
+        self.operator = "+"
+        self.operand1 = self.backend.zero
+        self.chained = chained
+        self.new_operand = True
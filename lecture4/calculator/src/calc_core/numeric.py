@@ -0,0 +1,184 @@
+# 電卓の数の扱い（バックエンド）を選べるようにする
+#   float     今までどおりの2進浮動小数点（速いが 0.1 + 0.2 = 0.30000000000000004）
+#   decimal   10進の decimal.Decimal。桁数（precision）を指定できる。お金の計算向け
+#   fraction  fractions.Fraction の分数で正確に計算する（1/3 * 3 = 1）
+# 電卓は値を表示の文字列ではなくバックエンドの数のまま持ち、表示するときだけ format() で文字列にする
+#   backend = get_backend("decimal", precision=50)
+#   backend.binary("+", backend.number("0.1"), backend.number("0.2"))  → Decimal('0.3')
+# √ や三角関数のように割り切れない結果は、decimal は指定の桁数で、fraction は同じ桁数の10進から分数にする
+import decimal
+import math
+import os
+from fractions import Fraction
+from functools import lru_cache
+
+from calc_core.expr import BINARY_OPS, FUNCTIONS, UNARY_OPS
+
+DEFAULT_BACKEND = os.environ.get("CALC_NUMERIC", "float")
+DEFAULT_PRECISION = int(os.environ.get("CALC_PRECISION", "28"))
+MEMO_SIZE = 256  # 関数キーの結果を覚えておく数
+
+
+def finite(value):
+    # float の桁あふれ（inf）や NaN は例外にする。電卓では "Error"（calc_core.batch でもエラーの要素になる）
+    if isinstance(value, float) and not math.isfinite(value):
+        raise OverflowError(f"計算結果が有限の数になりません: {value}")
+    return value
+
+
+class FloatBackend:
+    name = "float"
+
+    def __init__(self, precision=None):
+        self.zero = 0.0
+        # 最近の (関数名, 値) → 結果。同じ値に SIN などを押し直しても計算し直さない
+        self.function = lru_cache(maxsize=MEMO_SIZE)(self.unary)
+
+    def number(self, text):
+        return float(text)
+
+    def from_float(self, value):
+        return value
+
+    def convert(self, value):
+        # 別の数の種類の値（履歴の再計算などで使う）をこの種類にする
+        return float(value)
+
+    def binary(self, op, x, y):
+        return finite(BINARY_OPS[op](x, y))
+
+    def unary(self, name, x):
+        # name は FUNCTIONS の関数名か UNARY_OPS の記号（"%" / "-" など）
+        if name in FUNCTIONS:
+            return finite(FUNCTIONS[name][1](x))
+        return finite(UNARY_OPS[name](x))
+
+    def format(self, value):
+        # 整数になる値は整数で表示する（今までの format_number と同じ）
+        if math.isfinite(value) and value.is_integer():
+            return str(int(value))
+        return repr(value)
+
+
+class DecimalBackend(FloatBackend):
+    name = "decimal"
+    # 演算子 → decimal.Context のメソッド名
+    CONTEXT_OPS = {"+": "add", "-": "subtract", "*": "multiply", "/": "divide", "^": "power"}
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        # 0で割る・定義域の外・桁あふれは例外にする（電卓では "Error"）
+        self.context = decimal.Context(
+            prec=precision,
+            traps=[decimal.DivisionByZero, decimal.InvalidOperation, decimal.Overflow],
+        )
+        self.precision = precision
+        super().__init__()
+        self.zero = decimal.Decimal(0)
+
+    def number(self, text):
+        return self.context.create_decimal(text)
+
+    def from_float(self, value):
+        # 2進の誤差を持ち込まないよう repr（最短の10進表記）から作る
+        return self.context.create_decimal(repr(value))
+
+    def convert(self, value):
+        if isinstance(value, float):
+            return self.from_float(value)
+        if isinstance(value, Fraction):
+            return self.context.divide(value.numerator, value.denominator)
+        return self.context.create_decimal(value)
+
+    def binary(self, op, x, y):
+        return getattr(self.context, self.CONTEXT_OPS[op])(x, y)
+
+    def unary(self, name, x):
+        if name in ("sqrt", "√"):
+            return self.context.sqrt(x)
+        if name in ("sq", "²"):
+            return self.context.multiply(x, x)
+        if name == "%":
+            return self.context.divide(x, 100)
+        if name == "-":
+            return self.context.minus(x)
+        if name == "+":
+            return self.context.plus(x)
+        # 三角関数などは float で計算して戻す
+        return self.from_float(super().unary(name, float(x)))
+
+    def format(self, value):
+        value = self.context.normalize(value) if value else self.zero
+        # 桁が多すぎないときは指数表記にしない（1E+3 → 1000）
+        if -self.precision - 6 < value.adjusted() < self.precision:
+            return format(value, "f")
+        return str(value)
+
+
+class FractionBackend(FloatBackend):
+    name = "fraction"
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        # 割り切れない結果（√2 など）を分数にするときの10進の桁数
+        self.decimal = DecimalBackend(precision)
+        super().__init__()
+        self.zero = Fraction(0)
+
+    def number(self, text):
+        return Fraction(text)
+
+    def from_float(self, value):
+        return Fraction(repr(value))
+
+    def convert(self, value):
+        return self.from_float(value) if isinstance(value, float) else Fraction(value)
+
+    def binary(self, op, x, y):
+        result = BINARY_OPS[op](x, y)
+        # 分数乗（2 ^ 0.5 など）は float になるので分数に戻す
+        return result if isinstance(result, Fraction) else self.from_float(result)
+
+    def unary(self, name, x):
+        if name in ("sqrt", "√"):
+            if x < 0:
+                raise ValueError("負の数の平方根は計算できません")
+            root_n, root_d = math.isqrt(x.numerator), math.isqrt(x.denominator)
+            if root_n * root_n == x.numerator and root_d * root_d == x.denominator:
+                return Fraction(root_n, root_d)
+            return Fraction(self.decimal.unary("sqrt", self.decimal.context.divide(x.numerator, x.denominator)))
+        if name in ("sq", "²"):
+            return x * x
+        if name == "%":
+            return x / 100
+        if name in UNARY_OPS:
+            return UNARY_OPS[name](x)
+        return self.from_float(super().unary(name, float(x)))
+
+    def format(self, value):
+        # 割り切れる（分母が 2 と 5 だけ）なら10進で、そうでなければ 1/3 のような分数で表示する
+        if value.denominator == 1:
+            return str(value.numerator)
+        d, twos, fives = value.denominator, 0, 0
+        while d % 2 == 0:
+            d //= 2
+            twos += 1
+        while d % 5 == 0:
+            d //= 5
+            fives += 1
+        if d != 1:
+            return f"{value.numerator}/{value.denominator}"
+        digits = max(twos, fives)
+        scaled = abs(value.numerator) * 10 ** digits // value.denominator
+        sign = "-" if value < 0 else ""
+        whole, frac = divmod(scaled, 10 ** digits)
+        return f"{sign}{whole}.{frac:0{digits}d}"
+
+
+BACKENDS = {"float": FloatBackend, "decimal": DecimalBackend, "fraction": FractionBackend}
+
+
+def get_backend(name=None, precision=None):
+    # name / precision を省くと環境変数 CALC_NUMERIC / CALC_PRECISION（既定は float / 28 桁）
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"知らない数の種類です: {name}（{' / '.join(BACKENDS)}）")
+    return BACKENDS[name](precision or DEFAULT_PRECISION)
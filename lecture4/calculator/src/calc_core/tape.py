@@ -0,0 +1,194 @@
+# 電卓の履歴テープ。計算を1つずつ (演算, x, y, 結果) で記録し、別の開始値で計算し直せる
+#   tape = Tape(get_backend("decimal"))
+#   tape.record("+", None, Decimal("5"), Decimal("5"))   x / y が None なら「直前の結果」
+#   tape.replay(start=Decimal("10"))                     記録した操作を 10 から計算し直す
+#   tape.save("2026-10-18T10:00:00")                     SQLite に保存（まだ保存していない分だけ）
+#   python -m calc_core.tape list / show SESSION / replay SESSION --start 10
+# テープは決まった数だけ持つリングバッファ（古いものから消える）
+import argparse
+import sqlite3
+import sys
+from collections import deque
+from itertools import islice
+from typing import Any, NamedTuple, Optional
+
+from calc_core.numeric import BACKENDS, get_backend
+
+DB_PATH = "calc_history.db"
+TAPE_SIZE = 1000
+
+CREATE_TAPE_SQL = """
+    CREATE TABLE IF NOT EXISTS tape (
+        session TEXT,
+        seq INTEGER,
+        backend TEXT,
+        op TEXT,
+        x TEXT,
+        y TEXT,
+        result TEXT,
+        PRIMARY KEY (session, seq)
+    )
+"""
+INSERT_ENTRY_SQL = "INSERT OR REPLACE INTO tape VALUES (?, ?, ?, ?, ?, ?, ?)"
+SELECT_SESSION_SQL = """
+    SELECT backend, op, x, y, result FROM tape
+    WHERE session = ? ORDER BY seq DESC LIMIT ?
+"""
+SELECT_SESSIONS_SQL = "SELECT session, backend, COUNT(*) FROM tape GROUP BY session ORDER BY session"
+
+# AC は「開始値に戻す」。replay の start はここでも使う
+CLEAR = "AC"
+BINARY_KEYS = {"+", "-", "*", "/", "^"}
+# 単項のキー → calc_core.numeric の unary の名前（"-" は二項の引き算と区別するためキーの名前で記録する）
+UNARY_KEYS = {"+/-": "-", "%": "%"}
+
+
+class TapeEntry(NamedTuple):
+    op: str  # "+" / "-" / "*" / "/" / "^"、関数名（"sin" など）、"%" / "+/-"、"AC"
+    x: Optional[Any]  # None は直前の結果
+    y: Optional[Any]  # 二項演算の右側。単項なら None（直前の結果）
+    result: Optional[Any]  # None はエラー
+
+
+def _dump(value):
+    if value is None:
+        return None
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _load(text, backend):
+    return None if text is None else backend.number(text)
+
+
+class Tape:
+    def __init__(self, backend, size=TAPE_SIZE):
+        self.backend = backend
+        self.entries = deque(maxlen=size)
+        self.count = 0  # これまでに記録した数（消えた分も含む）
+        self.saved = 0  # そのうち保存済みの数
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def record(self, op, x, y, result):
+        self.entries.append(TapeEntry(op, x, y, result))
+        self.count += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.count = self.saved = 0
+
+    def replay(self, start=None, backend=None, entries=None):
+        # 記録した操作を start から計算し直して、結果のリストを返す（エラーは None）
+        # backend を渡すとその数の種類で計算する（float で記録したものを decimal で、など）
+        backend = backend or self.backend
+        convert = backend.convert if backend is not self.backend else (lambda v: v)
+        start = backend.zero if start is None else start
+        prev = start
+        results = []
+        for op, x, y, _ in (self.entries if entries is None else entries):
+            if op == CLEAR:
+                prev = start
+                results.append(prev)
+                continue
+            x = prev if x is None else convert(x)
+            if op in BINARY_KEYS:
+                y = prev if y is None else convert(y)
+            try:
+                if x is None or (op in BINARY_KEYS and y is None):
+                    # 前の計算がエラーなら AC まで続けてエラー
+                    raise ArithmeticError
+                if op in BINARY_KEYS:
+                    prev = backend.binary(op, x, y)
+                else:
+                    prev = backend.function(UNARY_KEYS.get(op, op), x)
+            except (ArithmeticError, ValueError):
+                prev = None
+            results.append(prev)
+        return results
+
+    def save(self, session, path=DB_PATH):
+        # まだ保存していない分だけ書く（リングバッファから消えた分は書けない）
+        pending = min(self.count - self.saved, len(self.entries))
+        if not pending:
+            return 0
+        first = self.count - pending
+        rows = [(session, first + i, self.backend.name, op, _dump(x), _dump(y), _dump(result))
+                for i, (op, x, y, result) in enumerate(islice(self.entries, len(self.entries) - pending, None))]
+        with sqlite3.connect(path) as conn:
+            conn.execute(CREATE_TAPE_SQL)
+            conn.executemany(INSERT_ENTRY_SQL, rows)
+        conn.close()
+        self.saved = self.count
+        return len(rows)
+
+    @classmethod
+    def load(cls, session, path=DB_PATH, size=TAPE_SIZE, precision=None):
+        # 保存したテープの新しいほうから size 件を読む。数の種類は記録したときのもの
+        with sqlite3.connect(path) as conn:
+            conn.execute(CREATE_TAPE_SQL)
+            rows = conn.execute(SELECT_SESSION_SQL, (session, size)).fetchall()
+        conn.close()
+        if not rows:
+            raise KeyError(f"履歴がありません: {session}")
+        backend = get_backend(rows[0][0], precision)
+        tape = cls(backend, size)
+        for _, op, x, y, result in reversed(rows):
+            tape.record(op, _load(x, backend), _load(y, backend), _load(result, backend))
+        tape.saved = tape.count
+        return tape
+
+
+def list_sessions(path=DB_PATH):
+    # [(セッション, 数の種類, 件数)]
+    with sqlite3.connect(path) as conn:
+        conn.execute(CREATE_TAPE_SQL)
+        rows = conn.execute(SELECT_SESSIONS_SQL).fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m calc_core.tape")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="保存したセッションの一覧")
+    show = sub.add_parser("show", help="テープの中身")
+    show.add_argument("session")
+    replay = sub.add_parser("replay", help="テープを計算し直す")
+    replay.add_argument("session")
+    replay.add_argument("--start", help="開始値（既定は 0）")
+    replay.add_argument("--numeric", choices=list(BACKENDS), help="計算する数の種類（既定は記録したとき）")
+    replay.add_argument("--precision", type=int)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for session, backend, count in list_sessions(args.db):
+            print(f"{session}\t{backend}\t{count}")
+        return 0
+    try:
+        tape = Tape.load(args.session, args.db, precision=getattr(args, "precision", None))
+    except KeyError as e:
+        raise SystemExit(e.args[0])
+    backend = tape.backend
+    if args.command == "show":
+        # ← は直前の結果
+        for op, x, y, result in tape:
+            operands = [] if op == CLEAR else [x, y] if op in BINARY_KEYS else [x]
+            print(op, *("←" if v is None else backend.format(v) for v in operands), "=",
+                  "Error" if result is None else backend.format(result))
+        return 0
+    if args.numeric:
+        backend = get_backend(args.numeric, args.precision)
+    start = backend.number(args.start) if args.start else None
+    results = tape.replay(start, backend)
+    for entry, result in zip(tape, results):
+        print(entry.op, "=", "Error" if result is None else backend.format(result))
+    return 1 if results and results[-1] is None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,22 @@
+import os
+import sys
+import threading
+from pathlib import Path
 import flet as ft
-import requests
 from datetime import datetime
 
-#　URL定義
-AREA_URL = "https://www.jma.go.jp/bosai/common/const/area.json"
-FORECAST_URL_BASE = "https://www.jma.go.jp/bosai/forecast/data/forecast/"
+# 共通パッケージ(weather_core)をリポジトリ直下から読み込む
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+# 気象庁APIの取得はキャッシュ付きの共通処理を使う
+from weather_core.fetch import FetchError, get_area, get_cached_area, get_office_forecast_swr
+from weather_core.parse import area_tree
+from weather_core.codes import CATEGORIES, get_weather_class
+from weather_core.tasks import LatestOnly
+from weather_core.keyed import KeyedControls
+from weather_core import metrics
+
+# 分類ごとの背景グラデーション。毎回作らずに同じものを使い回す
+GRADIENTS = {name: ft.LinearGradient(colors=list(theme.gradient)) for name, theme in CATEGORIES.items()}
 
 def main(page: ft.Page):
     # アプリ設定
@@ -15,36 +27,17 @@ def main(page: ft.Page):
     page.window_height = 850
     page.padding = 0
 
-    # いろんな天気のパータンに応じてアイコンと色を返す（４つとか変わるやつはむずいので今回は省略）
-    def get_weather_theme(text):
-        if "雷" in text and "雨" in text:
-            return "⛈️", ft.Colors.DEEP_PURPLE_600, ft.LinearGradient(colors=["#E9D5FF", "#C084FC"])
-        if "雷" in text:
-            return "⚡", ft.Colors.PURPLE_500, ft.LinearGradient(colors=["#F3E8FF", "#D8B4FE"])
-        if "雪" in text:
-            return "☃️", ft.Colors.CYAN_500, ft.LinearGradient(colors=["#E0F7FA", "#B2EBF2"])
-        if "晴" in text and "雨" in text:
-            return "🌦️", ft.Colors.ORANGE_400, ft.LinearGradient(colors=["#FFF7ED", "#BAE6FD"])
-        if ("曇" in text or "くもり" in text) and "雨" in text:
-            return "🌧️", ft.Colors.BLUE_GREY_600, ft.LinearGradient(colors=["#F1F5F9", "#CBD5E1"])
-        if "雨" in text:
-            return "🌧️", ft.Colors.BLUE_600, ft.LinearGradient(colors=["#E0F2FE", "#BAE6FD"])
-        if "晴" in text and ("曇" in text or "くもり" in text):
-             return "🌤️", ft.Colors.ORANGE_400, ft.LinearGradient(colors=["#FFF7ED", "#E2E8F0"])
-        if "晴" in text:
-            return "☀️", ft.Colors.ORANGE_600, ft.LinearGradient(colors=["#FFF7ED", "#FFEDD5"])
-        if "曇" in text or "くもり" in text:
-            return "☁️", ft.Colors.BLUE_GREY_400, ft.LinearGradient(colors=["#F1F5F9", "#E2E8F0"])
-        
-        # それ以外
-        return "🌤️", ft.Colors.INDIGO_400, ft.LinearGradient(colors=["#F8FAFC", "#F1F5F9"])
+    # 天気コードからアイコン・色・背景を返す（分類表は weather_core.codes で1回だけ作ってある）
+    def get_weather_theme(code):
+        theme = get_weather_class(code)
+        return theme.emoji, theme.color, GRADIENTS[theme.category]
 
     # --- 表示エリアの作成 ---
     content_area = ft.Column(expand=True, scroll="auto", spacing=30)
 
     # 今日の天気を表示するカードを作る関数
-    def create_hero_card(name, weather_text, temp, pop, wind):
-        emoji, theme_color, gradient_bg = get_weather_theme(weather_text)
+    def create_hero_card(name, weather_code, weather_text, temp, pop, wind):
+        emoji, theme_color, gradient_bg = get_weather_theme(weather_code)
         
         return ft.Container(
             gradient=gradient_bg,
@@ -87,169 +80,264 @@ def main(page: ft.Page):
             ])
         )
 
+    # 週間予報の小さなカードを作る関数
+    def create_weekly_card(formatted_date, emoji, pop_str, temp_min, temp_max):
+        return ft.Container(
+            width=100, padding=20, border_radius=20, bgcolor=ft.Colors.WHITE,
+            border=ft.border.all(1, "#F1F5F9"),
+            content=ft.Column([
+                ft.Text(formatted_date, size=12, color=ft.Colors.BLUE_GREY_400),
+                ft.Text(emoji, size=30),
+
+                # 降水確率（あれば表示）
+                ft.Container(
+                    content=ft.Text(f"{pop_str}%", size=11, color=ft.Colors.BLUE_GREY_700),
+                    bgcolor="#F1F5F9",
+                    padding=ft.padding.symmetric(horizontal=8, vertical=2),
+                    border_radius=10,
+                    visible=True if pop_str else False
+                ),
+
+                ft.Row([
+                    ft.Text(f"{temp_min}°", color=ft.Colors.BLUE_400, size=12),
+                    ft.Text(f"{temp_max}°", color=ft.Colors.RED_400, size=12),
+                ], spacing=5, alignment="center"),
+            ], horizontal_alignment="center", spacing=5)
+        )
+
+    # カードは (地域, 日付) ごとに覚えておき、中身が同じなら同じ部品を使い回す
+    # 作り直さなければ page.update() で送られるのは変わったところだけになる
+    hero_cards = KeyedControls(lambda args: create_hero_card(*args))
+    weekly_cards = KeyedControls(lambda args: create_weekly_card(*args))
+    weekly_title = ft.Text("📅 週間予報", size=18, weight="bold", color=ft.Colors.BLUE_GREY_800)
+    # 横にスクロールできる列（ずっと同じものを使う）
+    weekly_row = ft.Row(scroll="auto", spacing=15)
+    # 読み込み中の表示。表示中のカードは消さずに上に出す
+    loading = ft.ProgressBar(visible=False)
+    # 表示中のデータがどれくらい新しいか（最新／古い／オフライン）
+    status_text = ft.Text(size=12, weight="bold", color=ft.Colors.BLUE_GREY_700, visible=False)
+
+    # デバッグ表示（取得・パース・保存・描画の時間）。虫のボタンで出し入れする。WEATHER_DEBUG=1 なら最初から出す
+    debug_text = ft.Text(size=11, font_family="monospace", selectable=True)
+    debug_overlay = ft.Container(content=debug_text, bgcolor=ft.Colors.BLUE_GREY_50, padding=10, border_radius=8,
+                                 visible=os.environ.get("WEATHER_DEBUG") == "1")
+
+    def update():
+        # page.update() の時間も計測する。デバッグ表示は同じ更新でいっしょに書き換える
+        if debug_overlay.visible:
+            debug_text.value = metrics.summary_text()
+        with metrics.timer("render"):
+            page.update()
+
+    def toggle_debug(e):
+        with render_lock:
+            debug_overlay.visible = not debug_overlay.visible
+            update()
+
     # --- APIからデータを取ってきて表示を更新する ---
+    # 最後にクリックした地域の結果だけを表示するための目印
+    latest = LatestOnly()
+    # 表示の部品（カードの KeyedControls も含む）はいくつもの取得スレッドと裏の取り直しから書き換えるので、
+    # 「最新の処理か」の確認から update() までをこのロックの中で行う。show_weather の中でも取るので RLock
+    render_lock = threading.RLock()
+
     def update_weather(office_code, region_code, region_name):
-        # 読み込み中...を表示
-        content_area.controls = [ft.Container(ft.ProgressRing(), padding=100, alignment=ft.alignment.center)]
-        page.update()
+        # 読み込み中...を表示して、取得は別スレッドで行う（待っている間も画面が固まらない）
+        with render_lock:
+            loading.visible = True
+            update()
+        page.run_thread(load_weather, office_code, region_code, region_name, latest.start())
+
+    def load_weather(office_code, region_code, region_name, token):
+        # 古いキャッシュでもすぐ表示し、裏で気象庁に取り直せたら描き直す（stale-while-revalidate）
+        # 取得にはタイムアウト・取り直し・ブレーカーが付いているので、待ち続けることはない
+        # 取り直しの結果（on_update / on_error）は裏のスレッドから来るので、古いデータの表示とロックで順番にする
+        # 新しいデータを表示した後に古いデータで上書きしない・取り直しが終わった後にくるくるを残さない
+        revalidated = {"fresh": False, "failed": False}
+
+        def on_update(data):
+            with render_lock:
+                revalidated["fresh"] = True
+                show_weather(data, region_code, region_name, token, "🟢 最新")
+
+        def on_error(error):
+            with render_lock:
+                revalidated["failed"] = True
+                if latest.is_current(token):
+                    loading.visible = False
+                    status_text.value = "🔴 オフライン（保存済みのデータ）"
+                    update()
 
-        # 気象庁からデータを取得
-        url = f"{FORECAST_URL_BASE}{office_code}.json"
-        response = requests.get(url)
-        data = response.json()
+        try:
+            data, stale = get_office_forecast_swr(office_code, on_update, on_error)
+        except FetchError:
+            show_message(token, "⚠️ 通信できず、保存済みのデータもありません")
+            return
+        with render_lock:
+            if revalidated["fresh"]:
+                return
+            if revalidated["failed"]:
+                status, still_loading = "🔴 オフライン（保存済みのデータ）", False
+            elif stale:
+                status, still_loading = "🟡 前回の発表より前のデータ（更新中…）", True
+            else:
+                status, still_loading = "🟢 最新", False
+            show_weather(data, region_code, region_name, token, status, still_loading=still_loading)
 
+    def show_message(token, message):
+        # 表示できないときもくるくる（読み込み中）は必ず止める
+        with render_lock:
+            if not latest.is_current(token):
+                return
+            loading.visible = False
+            status_text.value = message
+            status_text.visible = True
+            content_area.controls = []
+            update()
+
+    def show_weather(data, region_code, region_name, token, status, still_loading=False):
+        # 取得中に別の地域が選ばれていたら、この結果は捨てる（カードを書き換える前に確かめる）
+        with render_lock:
+            if latest.is_current(token):
+                render_weather(data, region_code, region_name, token, status, still_loading)
+
+    def render_weather(data, region_code, region_name, token, status, still_loading):
         # 必要なデータを取り出し
-        # 時系列データ
-        time_series = data[0]["timeSeries"]
-        
-        # 今日の天気
-        weather_area = next(area for area in time_series[0]["areas"] if area["area"]["code"] == region_code)
-        pop_area     = next(area for area in time_series[1]["areas"] if area["area"]["code"] == region_code)
-        temp_area    = time_series[2]["areas"][0] # 気温は代表地点のものを使うことが多い
-
-        # 今日の天気カードを作って表示エリアに追加
-        hero_card = create_hero_card(
-            region_name, 
-            weather_area["weathers"][0],
-            temp_area["temps"][1] if len(temp_area["temps"]) > 1 else "--", # 最高気温
-            pop_area["pops"][0] if pop_area["pops"] else "0",
-            weather_area["winds"][0]
-        )
-        content_area.controls = [hero_card]
-        
-        # 週間予報があれば追加
+        # 気象庁の応答が想定と違う（地域が載っていない・形が違う）ときは、止まらずにメッセージを出す
+        try:
+            # 時系列データ
+            time_series = data[0]["timeSeries"]
+
+            # 今日の天気
+            weather_area = next((area for area in time_series[0]["areas"] if area["area"]["code"] == region_code), None)
+            pop_area     = next((area for area in time_series[1]["areas"] if area["area"]["code"] == region_code), None)
+            temp_area    = time_series[2]["areas"][0] if len(time_series) > 2 else {} # 気温は代表地点のものを使うことが多い
+            if weather_area is None:
+                show_message(token, f"⚠️ {region_name}の予報が見つかりませんでした")
+                return
+            temps = temp_area.get("temps", [])
+            pops = pop_area["pops"] if pop_area else []
+
+            # 今日の天気カードを作って表示エリアに追加
+            hero_card = hero_cards.get(region_code, (
+                region_name,
+                weather_area["weatherCodes"][0],
+                weather_area["weathers"][0],
+                temps[1] if len(temps) > 1 else "--", # 最高気温
+                pops[0] if pops else "0",
+                weather_area["winds"][0] if weather_area.get("winds") else "--"
+            ))
+        except (KeyError, IndexError, TypeError):
+            show_message(token, "⚠️ 予報データの形式が想定と違うため表示できませんでした")
+            return
+        controls = [hero_card]
+        cards = []
+
+        # 週間予報があれば追加（形が違えば週間予報だけ出さない）
         if len(data) > 1:
-            weekly_time_series = data[1]["timeSeries"]
-            weekly_weather_area = weekly_time_series[0]["areas"][0]
-            weekly_temp_area    = weekly_time_series[1]["areas"][0]
-            
-            # 横にスクロールできる列を作成
-            weekly_row = ft.Row(scroll="auto", spacing=15)
-            
-            # 1日ずつループしてカードを作る
-            for i in range(len(weekly_time_series[0]["timeDefines"])):
-                
-                code = weekly_weather_area["weatherCodes"][i]
-                weather_type = "曇"
-
-                if code.startswith("1"):
-                    if code in ["102", "112", "113", "114", "118", "119"]:
-                        weather_type = "晴雨"
-                    elif code in ["100", "123", "124", "130", "131"]:
-                        weather_type = "晴"
-                    else:
-                        weather_type = "晴曇"
-
-                elif code.startswith("2"):
-                    if code in ["202", "203", "206", "207", "212", "213", "214", "218", "219", "222", "224", "226"]:
-                         weather_type = "曇雨"
-                    elif code in ["201", "210", "211", "223", "230"]:
-                         weather_type = "曇晴"
-                    else:
-                         weather_type = "曇"
-
-                elif code.startswith("3"):
-                    weather_type = "雨"
-                    if code in ["313", "314", "317", "323", "324", "325"]:
-                        weather_type = "雨曇"
-                
-                elif code.startswith("4"):
-                    weather_type = "雪"
+            try:
+                weekly_time_series = data[1]["timeSeries"]
+                weekly_weather_area = weekly_time_series[0]["areas"][0]
+                weekly_temp_area    = weekly_time_series[1]["areas"][0]
 
-                emoji, _, _ = get_weather_theme(weather_type)
-                
-                # 日付のフォーマット（例: 01/05）
-                date_str = weekly_time_series[0]["timeDefines"][i]
-                date_dt = datetime.fromisoformat(date_str.replace('Z','+00:00'))
-                formatted_date = date_dt.strftime("%m/%d")
+                # 1日ずつループしてカードを作る
+                for i in range(len(weekly_time_series[0]["timeDefines"])):
 
-                # 降水確率
-                pop_str = weekly_weather_area['pops'][i]
-                
-                # 小さなカードを作成
-                card = ft.Container(
-                    width=100, padding=20, border_radius=20, bgcolor=ft.Colors.WHITE,
-                    border=ft.border.all(1, "#F1F5F9"),
-                    content=ft.Column([
-                        ft.Text(formatted_date, size=12, color=ft.Colors.BLUE_GREY_400),
-                        ft.Text(emoji, size=30),
-                        
-                        # 降水確率（あれば表示）
-                        ft.Container(
-                            content=ft.Text(f"{pop_str}%", size=11, color=ft.Colors.BLUE_GREY_700),
-                            bgcolor="#F1F5F9",
-                            padding=ft.padding.symmetric(horizontal=8, vertical=2),
-                            border_radius=10,
-                            visible=True if pop_str else False
-                        ),
+                    emoji, _, _ = get_weather_theme(weekly_weather_area["weatherCodes"][i])
 
-                        ft.Row([
-                            ft.Text(f"{weekly_temp_area['tempsMin'][i]}°", color=ft.Colors.BLUE_400, size=12),
-                            ft.Text(f"{weekly_temp_area['tempsMax'][i]}°", color=ft.Colors.RED_400, size=12),
-                        ], spacing=5, alignment="center"),
-                    ], horizontal_alignment="center", spacing=5)
-                )
-                weekly_row.controls.append(card)
+                    # 日付のフォーマット（例: 01/05）
+                    date_str = weekly_time_series[0]["timeDefines"][i]
+                    date_dt = datetime.fromisoformat(date_str.replace('Z','+00:00'))
+                    formatted_date = date_dt.strftime("%m/%d")
 
-            content_area.controls.append(ft.Text("📅 週間予報", size=18, weight="bold", color=ft.Colors.BLUE_GREY_800))
-            content_area.controls.append(weekly_row)
-        
-        page.update()
+                    # 降水確率
+                    pop_str = weekly_weather_area['pops'][i]
+
+                    # 小さなカード（前と同じ内容なら前の部品をそのまま使う）
+                    cards.append(weekly_cards.get((region_code, formatted_date), (
+                        formatted_date, emoji, pop_str,
+                        weekly_temp_area['tempsMin'][i], weekly_temp_area['tempsMax'][i],
+                    )))
+            except (KeyError, IndexError, TypeError, ValueError):
+                cards = []
+
+            if cards:
+                controls.append(weekly_title)
+                controls.append(weekly_row)
+
+        loading.visible = still_loading
+        status_text.value = status
+        status_text.visible = True
+        weekly_row.controls = cards
+        content_area.controls = controls
+        update()
 
     # --- サイドメニュー（地域リスト）を作る ---
-    sidebar = ft.Column(scroll="auto", spacing=0)
+    # 中身は開いたときに初めて作る。最初は地方の見出しだけ送るので起動が軽い
+    sidebar = ft.ListView(spacing=0, expand=True)
+
+    # 地域のボタンは全部この1つの関数で受ける（data に Region を持たせる）
+    def on_region_click(e):
+        region = e.control.data
+        update_weather(region.office_code, region.region_code, region.region_name)
+
+    def on_office_expand(e):
+        tile = e.control
+        if e.data == "true" and not tile.controls:
+            # その県の中の地域（東京地方、伊豆諸島など）
+            tile.controls = [
+                ft.ListTile(title=ft.Text(region.region_name, size=13), data=region, on_click=on_region_click)
+                for region in tile.data.regions
+            ]
+            tile.update()
+
+    def on_center_expand(e):
+        tile = e.control
+        if e.data == "true" and not tile.controls:
+            # 県のアコーディオンメニュー
+            tile.controls = [
+                ft.ExpansionTile(title=ft.Text(office.office_name, size=14, weight="bold"),
+                                 data=office, on_change=on_office_expand)
+                for office in tile.data.offices
+            ]
+            tile.update()
 
     def init_menu():
-        # エリア一覧を取得
-        res = requests.get(AREA_URL).json()
-        
-        # センター（地方）ごとにループ
-        for center_code, center_info in res["centers"].items():
-            offices_widgets = []
-            
-            # 各県（オフィス）ごとにループ
-            for office_code in center_info.get("children", []):
-                office_info = res["offices"][office_code]
-                
-                # その県の中の地域（東京地方、伊豆諸島など）
-                region_widgets = []
-                for region_code in office_info.get("children", []):
-                    if region_code in res["class10s"]:
-                        region_name = res["class10s"][region_code]["name"]
-                        
-                        # クリックしたら update_weather を呼ぶボタン
-                        tile = ft.ListTile(
-                            title=ft.Text(region_name, size=13),
-                            on_click=lambda e, oc=office_code, rc=region_code, rn=region_name: update_weather(oc, rc, rn)
-                        )
-                        region_widgets.append(tile)
-                
-                # 県のアコーディオンメニュー
-                offices_widgets.append(
-                    ft.ExpansionTile(
-                        title=ft.Text(office_info["name"], size=14, weight="bold"),
-                        controls=region_widgets
-                    )
-                )
-            
-            # 地方のアコーディオンメニュー
-            sidebar.controls.append(
-                ft.ExpansionTile(title=ft.Text(center_info["name"]), controls=offices_widgets)
-            )
-        page.update()
+        # エリア一覧を取得して、地方 → 県 → 地域 の木を1回だけ作る
+        # 一覧はほとんど変わらないので、キャッシュがあればネットワークには出ない
+        area, _ = get_cached_area()
+        if area is None:
+            try:
+                area = get_area()
+            except FetchError:
+                with render_lock:
+                    content_area.controls = [ft.Text("⚠️ 通信できないため地域一覧を取得できませんでした")]
+                    update()
+                return
+        tree = area_tree(area)
+
+        # 地方のアコーディオンメニュー
+        with render_lock:
+            sidebar.controls = [
+                ft.ExpansionTile(title=ft.Text(center.center_name), data=center, on_change=on_center_expand)
+                for center in tree
+            ]
+            update()
 
     # --- 全体のレイアウト組み立て ---
     page.appbar = ft.AppBar(
         title=ft.Text("天気予報", weight="bold", color=ft.Colors.BLUE_GREY_900),
-        bgcolor=ft.Colors.WHITE, elevation=0
+        bgcolor=ft.Colors.WHITE, elevation=0,
+        actions=[ft.IconButton(icon=ft.Icons.BUG_REPORT, tooltip="計測結果", on_click=toggle_debug)]
     )
 
     page.add(
         ft.Row([
             ft.Container(content=sidebar, width=280, bgcolor=ft.Colors.WHITE, padding=10),
-            ft.Container(content=content_area, padding=40, expand=True)
+            ft.Container(content=ft.Column([loading, debug_overlay, status_text, content_area], expand=True), padding=40, expand=True)
         ], expand=True, spacing=0)
     )
-    init_menu()
+    page.run_thread(init_menu)
 
-ft.app(target=main)
\ No newline at end of file
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,13 @@
+# 天気予報アプリ（lecture5 / leture6）で共通して使う処理をまとめたパッケージ
+# サブモジュールは触ったときに初めて読み込む（store や parse だけ使うなら requests や numpy は読まない）
+#   import weather_core
+#   weather_core.store.get_regions()
+import importlib
+
+SUBMODULES = ("analytics", "codes", "fetch", "keyed", "parse", "poller", "records", "refresh", "store", "tasks")
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,119 @@
+# 画面なしで使うためのコマンド
+#   python -m weather_core refresh   全国の予報をまとめて取得して保存する（失敗したオフィスがあれば終了コード1）
+#   python -m weather_core poll      気象庁の発表時刻（5時・11時・17時）に合わせて取得し続ける
+#   python -m weather_core export history.parquet   予報履歴を列形式（.parquet / .npz）で書き出す
+#   python -m weather_core stats     地域ごとの最低・最高・平均
+#   python -m weather_core skill     N日前の予報と当日の予報の誤差
+# サブコマンドで使うモジュールだけを読み込む（stats / export では requests を、refresh / poll では numpy を読まない）
+import argparse
+import logging
+import sys
+
+from weather_core import store
+
+
+def add_metrics_arguments(p):
+    p.add_argument("--metrics-file", help="取得のたびに Prometheus 形式の計測結果を書き出すファイル")
+    p.add_argument("--log-json", action="store_true", help="段階ごとの時間を JSON 1行ずつ標準エラーに出す")
+
+
+def add_range_arguments(p):
+    p.add_argument("--db", default=store.DB_PATH, help="読み込むDBファイル")
+    p.add_argument("--start", help="予報日の開始（YYYY-MM-DD）")
+    p.add_argument("--end", help="予報日の終了（YYYY-MM-DD）")
+    p.add_argument("--region", action="append", help="地域コード（複数指定可）")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m weather_core")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("refresh", help="全オフィスの予報を取得して保存する")
+    p.add_argument("--workers", type=int, default=None, help="同時に取得する数（既定 8）")
+    p.add_argument("--retries", type=int, default=None, help="失敗したときの再試行回数（既定 2）")
+    p.add_argument("--timeout", type=float, default=None, help="1リクエストの読み込みタイムアウト（秒）")
+    p.add_argument("--timings", action="store_true", help="段階ごとの所要時間を表示する")
+    add_metrics_arguments(p)
+    p = sub.add_parser("poll", help="発表時刻ごとに変化のあったオフィスだけ保存する")
+    p.add_argument("--workers", type=int, default=None, help="同時に取得する数（既定 8）")
+    p.add_argument("--once", action="store_true", help="1回だけ取得して終わる")
+    p.add_argument("--metrics-port", type=int, help="この番号で /metrics（Prometheus 形式）を返す")
+    add_metrics_arguments(p)
+    p = sub.add_parser("export", help="予報履歴を .parquet か .npz に書き出す")
+    p.add_argument("out", help="出力ファイル（拡張子で形式を決める）")
+    add_range_arguments(p)
+    p = sub.add_parser("stats", help="地域ごとの最低・最高・平均を表示する")
+    add_range_arguments(p)
+    p = sub.add_parser("skill", help="リードタイムごとの予報誤差を表示する")
+    add_range_arguments(p)
+    p.add_argument("--field", choices=("max_temp", "min_temp", "pop"), default="max_temp")
+    p.add_argument("--max-lead", type=int, default=7)
+    args = parser.parse_args()
+    if getattr(args, "log_json", False):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics_logger = logging.getLogger("weather_core.metrics")
+        metrics_logger.addHandler(handler)
+        metrics_logger.setLevel(logging.DEBUG)
+
+    if args.command == "refresh":
+        from weather_core import metrics, refresh
+        workers = args.workers or refresh.MAX_WORKERS
+        retries = refresh.RETRIES if args.retries is None else args.retries
+        timeout = refresh.TIMEOUT if args.timeout is None else (refresh.TIMEOUT[0], args.timeout)
+        result = refresh.refresh_all(workers, retries, timeout)
+        print(f"{result['offices']}オフィス / {result['regions']}地域 / {result['saved']}件保存")
+        for code, e in result["errors"].items():
+            print(f"  失敗 {code}: {e}")
+        if args.timings:
+            print(metrics.summary_text())
+        if args.metrics_file:
+            metrics.METRICS.write_file(args.metrics_file)
+        # 一部のオフィスでも失敗したら終了コード1（cron などで気づけるように）
+        if result["errors"]:
+            return 1
+    elif args.command == "poll":
+        from weather_core import metrics, poller, refresh
+        workers = args.workers or refresh.MAX_WORKERS
+        if args.metrics_port:
+            metrics.METRICS.serve(args.metrics_port)
+        if args.once:
+            if poller.poll_once(workers, args.metrics_file) is None:
+                return 1
+        else:
+            try:
+                poller.run(workers, metrics_file=args.metrics_file)
+            except KeyboardInterrupt:
+                pass
+    else:
+        # NumPy は分析のときだけ読み込む
+        from weather_core import analytics
+        regions = args.region or None
+        if args.command == "export":
+            if args.out.endswith(".npz"):
+                n = analytics.export_npz(args.out, args.db, args.start, args.end, regions)
+            else:
+                try:
+                    n = analytics.export_parquet(args.out, args.db, args.start, args.end, regions)
+                except RuntimeError as e:
+                    parser.error(str(e))
+            print(f"{n}行を {args.out} に書き出しました")
+        elif args.command == "stats":
+            cols = analytics.load_columns(args.db, args.start, args.end, regions)
+            stats = analytics.region_stats(cols)
+            print("地域      日数  最高気温(最小/最大/平均)  最低気温(最小/最大/平均)  降水確率平均")
+            for i, code in enumerate(stats["region_code"]):
+                print(f"{code:8s} {stats['count'][i]:5d}  "
+                      f"{stats['max_temp_min'][i]:6.1f} {stats['max_temp_max'][i]:6.1f} {stats['max_temp_mean'][i]:6.1f}  "
+                      f"{stats['min_temp_min'][i]:6.1f} {stats['min_temp_max'][i]:6.1f} {stats['min_temp_mean'][i]:6.1f}  "
+                      f"{stats['pop_mean'][i]:6.1f}")
+        elif args.command == "skill":
+            cols = analytics.load_columns(args.db, args.start, args.end, regions)
+            skill = analytics.forecast_skill(cols, args.field, args.max_lead)
+            print("何日前   件数     MAE    bias    RMSE")
+            for i, lead in enumerate(skill["lead"]):
+                print(f"{lead:6d} {skill['count'][i]:6d} {skill['mae'][i]:7.2f} {skill['bias'][i]:7.2f} "
+                      f"{skill['rmse'][i]:7.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# 予報履歴（forecasts テーブル）を列ごとの NumPy 配列に読み出して集計する分析用モジュール
+# 行ごとの Python ループは使わず、読み出しは fetchmany で少しずつ、集計は NumPy の配列演算で行う
+import sqlite3
+
+import numpy as np
+
+from weather_core.store import DB_PATH
+
+CHUNK_ROWS = 50_000
+# 列名と NumPy の型。欠損（NULL）は float の NaN になる
+COLUMNS = {
+    "region_code": "U16",
+    "forecast_date": "datetime64[D]",
+    "fetched_at": "datetime64[s]",
+    "max_temp": "float64",
+    "min_temp": "float64",
+    "pop": "float64",
+}
+VALUE_FIELDS = ("max_temp", "min_temp", "pop")
+SELECT_COLUMNS_SQL = f"SELECT {', '.join(COLUMNS)} FROM forecasts"
+
+
+def _select_sql(start=None, end=None, region_codes=None):
+    where, params = [], []
+    if start:
+        where.append("forecast_date >= ?")
+        params.append(str(start))
+    if end:
+        where.append("forecast_date <= ?")
+        params.append(str(end))
+    if region_codes:
+        where.append(f"region_code IN ({', '.join('?' * len(region_codes))})")
+        params.extend(region_codes)
+    sql = SELECT_COLUMNS_SQL + (" WHERE " + " AND ".join(where) if where else "")
+    return sql, params
+
+
+def _to_columns(rows):
+    # 行のリストを列ごとの配列にする（転置は zip で C 側に任せる）
+    values = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    return {name: np.array(col, dtype=dtype) for (name, dtype), col in zip(COLUMNS.items(), values)}
+
+
+def iter_chunks(path=DB_PATH, start=None, end=None, region_codes=None, chunk_rows=CHUNK_ROWS):
+    # chunk_rows 行ずつ {列名: 配列} を返す。全体をメモリに載せずに書き出せる
+    # 画面側の接続・ロックとは別に読み取り専用で開く（WAL なので書き込み中でも読める）
+    sql, params = _select_sql(start, end, region_codes)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield _to_columns(rows)
+    finally:
+        conn.close()
+
+
+def load_columns(path=DB_PATH, start=None, end=None, region_codes=None, chunk_rows=CHUNK_ROWS):
+    # 条件に合う行を全部読み、{列名: 配列} にまとめる。start / end は予報日（YYYY-MM-DD）
+    chunks = list(iter_chunks(path, start, end, region_codes, chunk_rows))
+    if not chunks:
+        return _to_columns([])
+    return {name: np.concatenate([c[name] for c in chunks]) for name in COLUMNS}
+
+
+def take(cols, index):
+    # 全部の列を同じ添字（マスクでもよい）で取り出す
+    return {name: values[index] for name, values in cols.items()}
+
+
+def latest_by_date(cols):
+    # (地域, 予報日) ごとに最後に取得した行だけを残す。取得回数の多い日が重く数えられないようにする
+    if len(cols["region_code"]) == 0:
+        return cols
+    order = np.lexsort((cols["fetched_at"], cols["forecast_date"], cols["region_code"]))
+    region = cols["region_code"][order]
+    date = cols["forecast_date"][order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (region[1:] != region[:-1]) | (date[1:] != date[:-1])
+    return take(cols, order[last])
+
+
+def region_stats(cols, start=None, end=None, fields=VALUE_FIELDS, latest=True):
+    # 地域ごとの最小・最大・平均。欠損は数えない
+    # 返り値: {"region_code": 地域, "count": 行数, "<列>_min" / "<列>_max" / "<列>_mean": 配列}
+    mask = np.ones(len(cols["region_code"]), dtype=bool)
+    if start:
+        mask &= cols["forecast_date"] >= np.datetime64(start, "D")
+    if end:
+        mask &= cols["forecast_date"] <= np.datetime64(end, "D")
+    cols = take(cols, mask)
+    if latest:
+        cols = latest_by_date(cols)
+
+    regions, inverse = np.unique(cols["region_code"], return_inverse=True)
+    result = {"region_code": regions, "count": np.bincount(inverse, minlength=len(regions))}
+    if len(regions) == 0:
+        for field in fields:
+            for stat in ("min", "max", "mean"):
+                result[f"{field}_{stat}"] = np.empty(0)
+        return result
+
+    # 地域順に並べ替えて、各地域の先頭位置から reduceat でまとめて集計する
+    order = np.argsort(inverse, kind="stable")
+    starts = np.searchsorted(inverse[order], np.arange(len(regions)))
+    for field in fields:
+        values = cols[field][order]
+        valid = ~np.isnan(values)
+        n = np.add.reduceat(valid.astype(np.int64), starts)
+        total = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[f"{field}_mean"] = total / n
+        # fmin / fmax は NaN を無視する（全部欠損なら NaN）
+        result[f"{field}_min"] = np.fmin.reduceat(values, starts)
+        result[f"{field}_max"] = np.fmax.reduceat(values, starts)
+    return result
+
+
+def forecast_skill(cols, field="max_temp", max_lead=7):
+    # N日前の予報を、その日の当日（0日前）の最後の予報と比べた誤差をリードタイムごとに集計する
+    # 返り値: {"lead": 1..max_lead, "count", "mae", "bias", "rmse"}
+    leads = np.arange(1, max_lead + 1)
+    empty = {"lead": leads, "count": np.zeros(max_lead, dtype=np.int64),
+             "mae": np.full(max_lead, np.nan), "bias": np.full(max_lead, np.nan), "rmse": np.full(max_lead, np.nan)}
+    values = cols[field]
+    if len(values) == 0:
+        return empty
+    lead = (cols["forecast_date"] - cols["fetched_at"].astype("datetime64[D]")).astype(np.int64)
+
+    # (地域, 予報日) を1つの整数キーにする
+    _, region_idx = np.unique(cols["region_code"], return_inverse=True)
+    day = (cols["forecast_date"] - cols["forecast_date"].min()).astype(np.int64)
+    key = region_idx.astype(np.int64) * (int(day.max()) + 1) + day
+
+    # 正解: 当日の予報のうち最後に取得したもの
+    is_truth = (lead == 0) & ~np.isnan(values)
+    truth_key, truth_fetched, truth_value = key[is_truth], cols["fetched_at"][is_truth], values[is_truth]
+    if len(truth_key) == 0:
+        return empty
+    order = np.lexsort((truth_fetched, truth_key))
+    truth_key, truth_value = truth_key[order], truth_value[order]
+    last = np.ones(len(truth_key), dtype=bool)
+    last[:-1] = truth_key[1:] != truth_key[:-1]
+    truth_key, truth_value = truth_key[last], truth_value[last]
+
+    # 予報: 1〜max_lead 日前の行を、同じキーの正解と突き合わせる
+    is_pred = (lead >= 1) & (lead <= max_lead) & ~np.isnan(values)
+    pred_key, pred_lead, pred_value = key[is_pred], lead[is_pred], values[is_pred]
+    pos = np.minimum(np.searchsorted(truth_key, pred_key), len(truth_key) - 1)
+    found = truth_key[pos] == pred_key
+    error = pred_value[found] - truth_value[pos[found]]
+    pred_lead = pred_lead[found]
+
+    count = np.bincount(pred_lead, minlength=max_lead + 1)[1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mae = np.bincount(pred_lead, weights=np.abs(error), minlength=max_lead + 1)[1:] / count
+        bias = np.bincount(pred_lead, weights=error, minlength=max_lead + 1)[1:] / count
+        rmse = np.sqrt(np.bincount(pred_lead, weights=error * error, minlength=max_lead + 1)[1:] / count)
+    return {"lead": leads, "count": count, "mae": mae, "bias": bias, "rmse": rmse}
+
+
+def export_npz(out_path, path=DB_PATH, start=None, end=None, region_codes=None):
+    # 列ごとの配列を .npz に保存する。np.load(out_path) でそのまま読める
+    cols = load_columns(path, start, end, region_codes)
+    np.savez_compressed(out_path, **cols)
+    return len(cols["region_code"])
+
+
+def export_parquet(out_path, path=DB_PATH, start=None, end=None, region_codes=None, chunk_rows=CHUNK_ROWS):
+    # Parquet に少しずつ書き出す。pyarrow は分析するときだけ必要なのでここで読み込む
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet で書き出すには pyarrow が必要です（pip install pyarrow）") from e
+
+    schema = pa.schema([
+        ("region_code", pa.string()),
+        ("forecast_date", pa.date32()),
+        ("fetched_at", pa.timestamp("s")),
+        ("max_temp", pa.float64()),
+        ("min_temp", pa.float64()),
+        ("pop", pa.float64()),
+    ])
+    total = 0
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for chunk in iter_chunks(path, start, end, region_codes, chunk_rows):
+            arrays = [pa.array(chunk[name], type=schema.field(name).type, from_pandas=True) for name in COLUMNS]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total += len(chunk["region_code"])
+    return total
@@ -0,0 +1,422 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from weather_core import metrics
+
+BASE_URL = "https://www.jma.go.jp/bosai/"
+AREA_URL = f"{BASE_URL}common/const/area.json"
+FORECAST_URL = f"{BASE_URL}forecast/data/forecast/"
+
+CACHE_DIR = Path("jma_cache")
+# JMA_OFFLINE=1 ならネットワークに出ずキャッシュだけを使う
+# JMA_FIXTURE_DIR を指定すると気象庁の代わりにそのフォルダのJSONを読む（BASE_URL 以下と同じ並び）
+OFFLINE = os.environ.get("JMA_OFFLINE") == "1"
+FIXTURE_DIR = os.environ.get("JMA_FIXTURE_DIR")
+TIMEOUT = (5, 20)  # (接続, 読み込み) 秒
+RETRIES = 2  # 失敗したときに取り直す回数（つながらない・タイムアウト・5xx・JSONでない応答）
+BACKOFF = 0.5  # 秒。失敗するたびに倍にし、0.5〜1.5倍のゆらぎを入れる
+BREAKER_THRESHOLD = 5  # 同じホストへの失敗がこの回数続いたら、しばらくリクエストを出さない
+BREAKER_RESET = 30.0  # 秒。この後に1回だけ試し、成功すれば元に戻す
+REVALIDATE_WORKERS = 2  # 裏で取り直すスレッドの数
+
+# 取得に失敗したときの例外。画面側は requests を知らなくていいようにここで名前を付けておく
+FetchError = requests.RequestException
+
+
+class CircuitOpenError(requests.ConnectionError):
+    # ブレーカーが開いているので、気象庁には問い合わせずに失敗させた
+    pass
+
+JST = timezone(timedelta(hours=9))
+# 気象庁の府県天気予報の定時発表（JST）
+PUBLISH_HOURS = (5, 11, 17)
+# 発表直後はまだ反映されていないことがあるので少し待つ
+PUBLISH_DELAY = timedelta(minutes=10)
+AREA_TTL = 7 * 24 * 60 * 60  # area.json はほぼ年1回しか変わらない
+
+
+def next_publish_time(now=None):
+    now = now or datetime.now(JST)
+    day = now.replace(minute=0, second=0, microsecond=0)
+    for d in range(2):
+        for hour in PUBLISH_HOURS:
+            t = day.replace(hour=hour) + timedelta(days=d) + PUBLISH_DELAY
+            if t > now:
+                return t
+    return day + timedelta(days=2)
+
+
+def previous_publish_time(now=None):
+    # 直近（現在以前）の発表時刻。次の発表時刻から1つ戻る
+    now = now or datetime.now(JST)
+    day = now.replace(minute=0, second=0, microsecond=0)
+    for d in range(0, -2, -1):
+        for hour in reversed(PUBLISH_HOURS):
+            t = day.replace(hour=hour) + timedelta(days=d) + PUBLISH_DELAY
+            if t <= now:
+                return t
+    return day - timedelta(days=2)
+
+
+def is_stale(fetched):
+    # 直近の発表より前に取ったデータなら古い
+    return fetched is None or fetched < previous_publish_time()
+
+
+def ttl_for(url):
+    # URLごとの有効期限（秒）
+    if url == AREA_URL:
+        return AREA_TTL
+    if url.startswith(FORECAST_URL):
+        now = datetime.now(JST)
+        return (next_publish_time(now) - now).total_seconds()
+    return 0
+
+
+def is_retryable(error):
+    # 取り直して直る見込みがある失敗か（4xx は何度やっても同じなので取り直さない）
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.InvalidJSONError))
+
+
+class CircuitBreaker:
+    # ホストごとのブレーカー。失敗が続いたら reset_after 秒はすぐに CircuitOpenError にする
+    # （気象庁が落ちているときにクリックのたびにタイムアウトまで待たせない）
+    def __init__(self, host, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.host = host
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def before_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.trial or time.monotonic() - self.opened_at < self.reset_after:
+                metrics.inc("circuit_rejected", host=self.host)
+                raise CircuitOpenError(f"{self.host} への接続を一時停止しています")
+            # 時間が経ったので1回だけ通してみる
+            self.trial = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial:
+                    metrics.inc("circuit_opened", host=self.host)
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+class _Call:
+    # 同じURLの取得を1本にまとめるための入れ物
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CachedFetcher:
+    # requests.Session を使い回し、ETag / Last-Modified で再検証するディスクキャッシュ付きの取得処理
+    # 失敗は取り直し（ゆらぎ付き）とホストごとのブレーカーで抑え、同じURLの同時取得は1本にまとめる
+    def __init__(self, cache_dir=CACHE_DIR, session=None, offline=False):
+        self.cache_dir = Path(cache_dir)
+        self.session = session or self._new_session()
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.calls_lock = threading.Lock()
+        self.calls = {}
+        self.breakers = {}
+        self.pool = None
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.body", self.cache_dir / f"{key}.meta.json"
+
+    def _load(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def _write(self, path, data):
+        # 途中で落ちても壊れたファイルが残らないように一時ファイルから置き換える
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _save(self, url, meta, body=None):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path, meta_path = self._paths(url)
+        with self.lock:
+            if body is not None:
+                self._write(body_path, body)
+            self._write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _drop(self, url):
+        with self.lock:
+            for path in self._paths(url):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def get_cached(self, url):
+        # 期限に関係なくキャッシュだけを見る。(data, 最後に気象庁と確認した時刻) か (None, None)
+        meta, body = self._load(url)
+        data = self._decode_cached(url, body) if meta else None
+        if data is None:
+            return None, None
+        return data, datetime.fromtimestamp(meta.get("fetched", 0), JST)
+
+    def _decode(self, body):
+        with metrics.timer("decode"):
+            return json.loads(body)
+
+    def _decode_cached(self, url, body):
+        # 途中で切れた・壊れたキャッシュは消して、キャッシュが無いのと同じ扱い（None）にする
+        try:
+            return self._decode(body)
+        except ValueError:
+            metrics.inc("cache", result="corrupt")
+            self._drop(url)
+            return None
+
+    def breaker(self, url):
+        host = urlsplit(url).netloc
+        with self.calls_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host)
+            return self.breakers[host]
+
+    def get_json(self, url, ttl=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+        ttl = ttl_for(url) if ttl is None else ttl
+        meta, body = self._load(url)
+        if meta and (self.offline or time.time() < meta["expires"]):
+            data = self._decode_cached(url, body)
+            if data is not None:
+                metrics.inc("cache", result="hit")
+                return data
+        if self.offline:
+            metrics.inc("cache", result="offline_miss")
+            raise requests.ConnectionError(f"オフラインでキャッシュもありません: {url}")
+        return self._single_flight(url, lambda: self._fetch(url, ttl, timeout, retries, backoff))
+
+    def get_json_swr(self, url, on_update=None, on_error=None, ttl=None, timeout=TIMEOUT):
+        # stale-while-revalidate: キャッシュがあれば古くてもすぐ (data, True) を返し、裏で取り直す
+        # 取り直せたら on_update(data)、失敗したら on_error(error) を裏のスレッドから呼ぶ
+        # キャッシュが無ければその場で取りに行き (data, False) を返す
+        ttl = ttl_for(url) if ttl is None else ttl
+        meta, body = self._load(url)
+        data = self._decode_cached(url, body) if meta else None
+        if data is None:
+            return self.get_json(url, ttl, timeout), False
+        if self.offline or time.time() < meta["expires"]:
+            metrics.inc("cache", result="hit")
+            return data, False
+        metrics.inc("cache", result="stale")
+        with self.calls_lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix="revalidate")
+        self.pool.submit(self._revalidate, url, ttl, timeout, on_update, on_error)
+        return data, True
+
+    def _revalidate(self, url, ttl, timeout, on_update, on_error):
+        try:
+            data = self.get_json(url, ttl, timeout)
+        except requests.RequestException as e:
+            if on_error:
+                on_error(e)
+            return
+        if on_update:
+            on_update(data)
+
+    def _single_flight(self, url, func):
+        # 同じURLを取りに行っている最中なら、新しく出さずにその結果を待つ
+        with self.calls_lock:
+            call = self.calls.get(url)
+            leader = call is None
+            if leader:
+                call = self.calls[url] = _Call()
+        if not leader:
+            metrics.inc("fetch_shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.calls_lock:
+                del self.calls[url]
+            call.done.set()
+
+    def _fetch(self, url, ttl, timeout, retries, backoff):
+        breaker = self.breaker(url)
+        for attempt in range(retries + 1):
+            breaker.before_request()
+            try:
+                data = self._request(url, ttl, timeout)
+            except requests.RequestException as e:
+                if not is_retryable(e):
+                    # 4xx などは相手が応答しているのでホストの失敗には数えない
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt == retries:
+                    raise
+                metrics.inc("retries")
+                time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                return data
+
+    def _request(self, url, ttl, timeout):
+        # 1回分のリクエスト。キャッシュがあれば条件付きで聞き、304 ならキャッシュを返す
+        meta, body = self._load(url)
+        now = time.time()
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            with metrics.timer("http"):
+                res = self.session.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException:
+            metrics.inc("http_errors")
+            raise
+        metrics.inc("http_responses", status=res.status_code)
+
+        if res.status_code == 304 and meta:
+            # 変わっていないので期限だけ延ばしてキャッシュを返す
+            metrics.inc("cache", result="revalidated")
+            data = self._decode_cached(url, body)
+            if data is None:
+                # 手元の本文が壊れていたので、条件なしで取り直す
+                return self._request(url, ttl, timeout)
+            meta["expires"] = now + ttl
+            meta["fetched"] = now
+            self._save(url, meta)
+            return data
+
+        res.raise_for_status()
+        metrics.inc("cache", result="miss")
+        metrics.inc("http_bytes", len(res.content))
+        with metrics.timer("decode"):
+            data = res.json()
+        self._save(url, {
+            "url": url,
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "expires": now + ttl,
+            "fetched": now,
+        }, res.content)
+        return data
+
+
+class FixtureFetcher:
+    # 気象庁の代わりにローカルのJSONを返す（オフラインでの動作確認・テスト用）
+    def __init__(self, fixture_dir):
+        self.fixture_dir = Path(fixture_dir)
+
+    def _path(self, url):
+        if not url.startswith(BASE_URL):
+            raise requests.ConnectionError(f"fixture にない URL です: {url}")
+        return self.fixture_dir / url[len(BASE_URL):]
+
+    def get_cached(self, url):
+        path = self._path(url)
+        try:
+            text = path.read_text(encoding="utf-8")
+            with metrics.timer("decode"):
+                data = json.loads(text)
+        except (OSError, ValueError):
+            return None, None
+        return data, datetime.fromtimestamp(path.stat().st_mtime, JST)
+
+    def get_json(self, url, ttl=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+        data, _ = self.get_cached(url)
+        if data is None:
+            raise requests.ConnectionError(f"fixture がありません: {self._path(url)}")
+        return data
+
+    def get_json_swr(self, url, on_update=None, on_error=None, ttl=None, timeout=TIMEOUT):
+        return self.get_json(url), False
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = FixtureFetcher(FIXTURE_DIR) if FIXTURE_DIR else CachedFetcher(offline=OFFLINE)
+        return _fetcher
+
+
+def get_area():
+    return get_fetcher().get_json(AREA_URL)
+
+
+def get_office_forecast(office_code, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+    return get_fetcher().get_json(f"{FORECAST_URL}{office_code}.json", timeout=timeout, retries=retries,
+                                  backoff=backoff)
+
+
+def get_office_forecast_swr(office_code, on_update=None, on_error=None):
+    # 古いキャッシュでもすぐ返して裏で取り直す版。(data, 古いかどうか)
+    return get_fetcher().get_json_swr(f"{FORECAST_URL}{office_code}.json", on_update, on_error)
+
+
+# ネットワークに出ずにキャッシュだけから返す版。(data, 取得時刻) か (None, None)
+def get_cached_area():
+    return get_fetcher().get_cached(AREA_URL)
+
+
+def get_cached_office_forecast(office_code):
+    return get_fetcher().get_cached(f"{FORECAST_URL}{office_code}.json")
@@ -0,0 +1,30 @@
+from collections import OrderedDict
+
+
+class KeyedControls:
+    # キーごとに画面部品（Fletのコントロール）を覚えておき、内容が同じならそのまま使い回す
+    # 同じインスタンスなら page.update() で差分しか送られないので、全部作り直すより軽い
+    #   build(value) -> control            新しく作る
+    #   patch(control, value) -> None      既存の部品を書き換える（省略時は作り直す）
+    def __init__(self, build, patch=None, max_size=256):
+        self.build = build
+        self.patch = patch
+        self.max_size = max_size
+        self.items = OrderedDict()  # key → (value, control)
+
+    def get(self, key, value):
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+            old_value, control = item
+            if old_value == value:
+                return control
+            if self.patch is not None:
+                self.patch(control, value)
+                self.items[key] = (value, control)
+                return control
+        control = self.build(value)
+        self.items[key] = (value, control)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+        return control
@@ -0,0 +1,185 @@
+# 取得・パース・保存・描画の各段階の時間と件数を数える
+#   with timer("http"): ...          段階ごとの時間（ヒストグラム＋直近の値）
+#   inc("cache", result="hit")       カウンター
+# 結果は Prometheus のテキスト形式（ファイル／HTTP）と JSON 1行のログ（logger "weather_core.metrics"）で見られる
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "weather"
+# ヒストグラムの区切り（秒）
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT = 256  # 画面のデバッグ表示で使う直近の件数
+# 段階ごとの目標時間（秒）。超えたら slo_violations を数える
+SLOS = {
+    "refresh": 60.0,
+    "http": 5.0,
+    "decode": 0.2,
+    "parse": 0.1,
+    "db_write": 0.5,
+    "render": 0.2,
+}
+
+logger = logging.getLogger("weather_core.metrics")
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Stage:
+    # 1つの段階（＋ラベル）の集計
+    __slots__ = ("count", "total", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=RECENT)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, **labels):
+        key = _key(stage, labels)
+        with self.lock:
+            if key not in self.stages:
+                self.stages[key] = Stage()
+            self.stages[key].observe(seconds)
+        slo = SLOS.get(stage)
+        if slo is not None and seconds > slo:
+            self.inc("slo_violations", stage=stage)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({"stage": stage, "seconds": round(seconds, 6), **labels}, ensure_ascii=False))
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def summary(self):
+        # 画面表示用: [(段階, ラベル, 回数, 直近, p50, p95)]（秒）。ラベル違いは段階ごとに並べる
+        with self.lock:
+            return [(name, dict(labels), s.count, s.recent[-1] if s.recent else None,
+                     s.percentile(0.5), s.percentile(0.95))
+                    for (name, labels), s in sorted(self.stages.items())]
+
+    def render_prometheus(self):
+        # Prometheus のテキスト形式
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            stages = sorted(self.stages.items())
+            seen = set()
+            for (name, labels), value in counters:
+                metric = f"{PREFIX}_{name}_total"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} counter")
+                    seen.add(metric)
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+            if stages:
+                metric = f"{PREFIX}_stage_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), s in stages:
+                base = (("stage", name),) + labels
+                cumulative = 0
+                for bound, n in zip(BUCKETS, s.buckets):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{_format_labels(base, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(base, [('le', '+Inf')])} {s.count}")
+                lines.append(f"{metric}_sum{_format_labels(base)} {s.total:.6f}")
+                lines.append(f"{metric}_count{_format_labels(base)} {s.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        # node_exporter の textfile collector などから読めるよう、一時ファイルから置き換える
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        # /metrics を返す HTTP サーバーを裏のスレッドで動かす
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.stages.clear()
+
+
+# プロセスで1つだけ持つ。各モジュールからは下の関数で使う
+METRICS = Metrics()
+timer = METRICS.timer
+observe = METRICS.observe
+inc = METRICS.inc
+summary = METRICS.summary
+render_prometheus = METRICS.render_prometheus
+
+
+def summary_text():
+    # デバッグ表示用の短い文字列（ミリ秒）
+    lines = []
+    for name, labels, count, last, p50, p95 in summary():
+        label = " ".join(f"{k}={v}" for k, v in labels.items())
+        lines.append(f"{name:9s}{(' ' + label) if label else ''}  n={count}  "
+                     f"last={last * 1000:.1f}ms  p50={p50 * 1000:.1f}ms  p95={p95 * 1000:.1f}ms")
+    return "\n".join(lines) or "まだ計測していません"
@@ -0,0 +1,203 @@
+from weather_core.codes import get_weather_name
+from weather_core.records import Center, DailyForecast, Office, Region, to_float, to_int
+
+
+# area.json から全ての class10 地域を Region にする
+def area_regions(area):
+    regions = []
+    for office_code, office_info in area["offices"].items():
+        for region_code in office_info.get("children", []):
+            if region_code in area["class10s"]:
+                regions.append(Region(region_code, area["class10s"][region_code]["name"],
+                                      office_code, office_info["name"]))
+    return regions
+
+
+# area.json から 地方(center) → 府県(office) → 地域(class10) の木を1回で作る
+def area_tree(area):
+    class10s = area["class10s"]
+    centers = []
+    for center_code, center_info in area["centers"].items():
+        offices = []
+        for office_code in center_info.get("children", []):
+            office_info = area["offices"].get(office_code)
+            if not office_info:
+                continue
+            regions = tuple(Region(code, class10s[code]["name"], office_code, office_info["name"])
+                            for code in office_info.get("children", []) if code in class10s)
+            offices.append(Office(office_code, office_info["name"], regions))
+        centers.append(Center(center_code, center_info["name"], tuple(offices)))
+    return centers
+
+
+# 予報JSONの発表時刻（reportDatetime）。同じ値なら中身も同じ
+def report_datetime(data):
+    try:
+        return data[0]["reportDatetime"]
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+def _dates(time_defines):
+    # "2026-01-01T11:00:00+09:00" → "2026-01-01"。timeDefine ごとに1回だけ分割する
+    return [t.split("T", 1)[0] for t in time_defines]
+
+
+def _series(data, block, index):
+    try:
+        series = data[block]["timeSeries"][index]
+    except (IndexError, KeyError, TypeError):
+        return None
+    return series if "areas" in series else None
+
+
+def _index_areas(series):
+    # 地域コード → area。同じコードが複数あれば先に出てきた方を使う
+    index = {}
+    if series:
+        for area in series["areas"]:
+            index.setdefault(area.get("area", {}).get("code"), area)
+    return index
+
+
+def _value(values, i):
+    return values[i] if i < len(values) and values[i] else None
+
+
+def _daily_temps(series):
+    # 今日〜明日の気温（代表地点 areas[0]）から日付ごとの最高・最低を決める
+    result = {}
+    if not series or not series["areas"]:
+        return result
+    temps = series["areas"][0].get("temps", [])
+    by_date = {}
+    for i, time_str in enumerate(series.get("timeDefines", [])):
+        temp = _value(temps, i)
+        if temp is None:
+            continue
+        date, _, clock = time_str.partition("T")
+        entries = by_date.setdefault(date, [])
+        if clock:
+            entries.append((int(clock[:2]), temp, float(temp)))
+    for date, entries in by_date.items():
+        fc = result[date] = {}
+        if len(entries) == 1:
+            hour, temp, _ = entries[0]
+            if 0 <= hour <= 6:
+                fc["min"] = temp
+            else:
+                fc["max"] = temp
+        elif len(entries) >= 2:
+            morning = [e for e in entries if e[0] <= 6]
+            fc["min"] = morning[0][1] if morning else min(entries, key=lambda e: e[2])[1]
+            daytime = [e for e in entries if 9 <= e[0] <= 15]
+            if daytime:
+                fc["max"] = max(daytime, key=lambda e: e[2])[1]
+            else:
+                # 同じ値が並んだときは後ろの方（安定ソートの末尾と同じ）
+                fc["max"] = max(reversed(entries), key=lambda e: e[2])[1]
+            if fc["min"] == fc["max"]:
+                by_hour = sorted(entries, key=lambda e: e[0])
+                fc["min"] = by_hour[0][1]
+                fc["max"] = by_hour[-1][1]
+    return result
+
+
+def _weekly_temps(series):
+    # 週間予報の気温。値がなければ予測範囲（Upper/Lower）で補う
+    result = {}
+    if not series or not series["areas"]:
+        return result
+    area = series["areas"][0]
+    columns = [area.get(k, []) for k in ("tempsMax", "tempsMaxUpper", "tempsMaxLower",
+                                         "tempsMin", "tempsMinLower", "tempsMinUpper")]
+    for i, date in enumerate(_dates(series.get("timeDefines", []))):
+        fc = result.setdefault(date, {})
+        max_t = _value(columns[0], i) or _value(columns[1], i) or _value(columns[2], i)
+        min_t = _value(columns[3], i) or _value(columns[4], i) or _value(columns[5], i)
+        if max_t and min_t:
+            if max_t == min_t:
+                fc["max"] = max_t
+            elif float(max_t) >= float(min_t):
+                fc["max"], fc["min"] = max_t, min_t
+            else:
+                fc["max"], fc["min"] = min_t, max_t
+        elif max_t:
+            fc["max"] = max_t
+        elif min_t:
+            fc["min"] = min_t
+    return result
+
+
+# 1オフィス分の予報JSONを1回なめて、オフィス内の全地域の予報行をまとめて作る
+# 戻り値: {region_code: [DailyForecast, ...]}
+def parse_office_forecast(data, office_code=None, region_codes=None):
+    weather_series = _series(data, 0, 0)
+    pop_series = _series(data, 0, 1)
+    weekly_series = _series(data, 1, 0)
+    weather_areas = _index_areas(weather_series)
+    pop_areas = _index_areas(pop_series)
+    weekly_areas = _index_areas(weekly_series)
+
+    weather_dates = _dates(weather_series.get("timeDefines", [])) if weather_series else []
+    pop_dates = _dates(pop_series.get("timeDefines", [])) if pop_series else []
+    weekly_dates = _dates(weekly_series.get("timeDefines", [])) if weekly_series else []
+    # 気温は地域によらず代表地点の値なので、オフィスごとに1回だけ計算する
+    daily_temps = _daily_temps(_series(data, 0, 2))
+    weekly_temps = _weekly_temps(_series(data, 1, 1))
+
+    if region_codes is None:
+        region_codes = [c for c in list(weather_areas) + list(pop_areas) if c is not None]
+        region_codes = list(dict.fromkeys(region_codes))
+
+    result = {}
+    for region_code in region_codes:
+        forecasts = {}
+        area = weather_areas.get(region_code)
+        if area:
+            weathers = area.get("weathers", [])
+            codes = area.get("weatherCodes")
+            for i, date in enumerate(weather_dates):
+                fc = forecasts.setdefault(date, {})
+                if i < len(weathers):
+                    fc["weather"] = weathers[i]
+                if codes is not None and i < len(codes):
+                    fc["weather_code"] = codes[i]
+        area = pop_areas.get(region_code)
+        if area:
+            pops = area.get("pops", [])
+            for i, date in enumerate(pop_dates):
+                fc = forecasts.setdefault(date, {})
+                pop = _value(pops, i)
+                if pop and "pop" not in fc:
+                    fc["pop"] = pop
+        for date, temps in daily_temps.items():
+            forecasts.setdefault(date, {}).update(temps)
+        area = weekly_areas.get(region_code) or weekly_areas.get(office_code)
+        if area:
+            codes = area.get("weatherCodes", [])
+            pops = area.get("pops", [])
+            for i, date in enumerate(weekly_dates):
+                fc = forecasts.setdefault(date, {})
+                code = _value(codes, i)
+                if code:
+                    fc["weather"] = get_weather_name(code)
+                    fc["weather_code"] = code
+                pop = _value(pops, i)
+                if pop:
+                    fc["pop"] = pop
+        for date, temps in weekly_temps.items():
+            forecasts.setdefault(date, {}).update(temps)
+        result[region_code] = forecast_rows(forecasts)
+    return result
+
+
+# 日付順の DailyForecast にする。数値への変換はここで1回だけ行う
+def forecast_rows(forecasts):
+    rows = []
+    for date in sorted(forecasts.keys()):
+        fc = forecasts[date]
+        if fc.get("weather") or fc.get("max") or fc.get("min"):
+            rows.append(DailyForecast(date, fc.get("weather", ""), to_float(fc.get("max")),
+                                      to_float(fc.get("min")), to_int(fc.get("pop")), fc.get("weather_code")))
+    return rows
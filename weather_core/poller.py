@@ -0,0 +1,64 @@
+# 画面なしで気象庁の発表時刻に合わせて予報を取りに行く定期取得
+import threading
+from datetime import datetime, timedelta
+
+from weather_core import metrics, refresh
+from weather_core.fetch import JST, FetchError, next_publish_time, previous_publish_time
+from weather_core.store import init_db, get_watermarks
+
+# 取得に失敗したら次の発表を待たずにやり直す。続けて失敗するたびに倍にする（RETRY_MAX 秒まで）
+RETRY_AFTER = 60
+RETRY_MAX = 30 * 60
+
+
+def log(message):
+    print(f"[{datetime.now(JST).isoformat(timespec='seconds')}] {message}", flush=True)
+
+
+def polled_since_last_publish(now=None):
+    # 直近の発表より後に全オフィスを確認済みなら、再起動直後に取りに行く必要はない
+    watermarks = get_watermarks()
+    if not watermarks:
+        return False
+    last_publish = previous_publish_time(now).isoformat(timespec="seconds")
+    return min(checked_at for _, checked_at in watermarks.values()) >= last_publish
+
+
+def poll_once(max_workers=refresh.MAX_WORKERS, metrics_file=None):
+    # 地域一覧（area.json）が取れないなど全体が失敗したときは None。定期取得は止めない
+    try:
+        result = refresh.refresh_all(max_workers, skip_unchanged=True)
+    except FetchError as e:
+        metrics.inc("poll_failures")
+        log(f"取得できませんでした: {e}")
+        if metrics_file:
+            metrics.METRICS.write_file(metrics_file)
+        return None
+    if metrics_file:
+        metrics.METRICS.write_file(metrics_file)
+    log(f"{result['offices']}オフィス確認 / 変化なし {result['skipped']} / "
+        f"{result['regions']}地域 {result['saved']}件保存 / 失敗 {len(result['errors'])}")
+    for code, e in result["errors"].items():
+        log(f"  失敗 {code}: {e}")
+    return result
+
+
+def run(max_workers=refresh.MAX_WORKERS, stop=None, metrics_file=None):
+    # stop (threading.Event) がセットされるまで、発表時刻の少し後に起きて取得を繰り返す
+    # 取得に失敗しても終わらない（少し待ってやり直す）。終わるのは stop のときだけ
+    stop = stop or threading.Event()
+    init_db()
+    failures = 0
+    if polled_since_last_publish():
+        log("前回の発表分は取得済みなので次の発表まで待ちます")
+    elif poll_once(max_workers, metrics_file) is None:
+        failures = 1
+    while not stop.is_set():
+        wake = next_publish_time()
+        if failures:
+            retry = datetime.now(JST) + timedelta(seconds=min(RETRY_AFTER * 2 ** (failures - 1), RETRY_MAX))
+            wake = min(wake, retry)
+        log(f"次回 {wake.isoformat(timespec='minutes')}")
+        if stop.wait(max(0.0, (wake - datetime.now(JST)).total_seconds())):
+            break
+        failures = failures + 1 if poll_once(max_workers, metrics_file) is None else 0
@@ -0,0 +1,65 @@
+from typing import NamedTuple, Optional, Tuple
+
+# 画面・DB・パーサーの間で受け渡すレコード型
+# NamedTuple は __slots__ = () なので1件あたりのメモリが小さく、sqlite3 の行からそのまま作れる
+
+
+def to_float(value):
+    if value is None or str(value).strip() == "":
+        return None
+    return float(value)
+
+
+def to_int(value):
+    if value is None or str(value).strip() == "":
+        return None
+    return int(value)
+
+
+class Region(NamedTuple):
+    region_code: str
+    region_name: str
+    office_code: str
+    office_name: str
+
+
+class Office(NamedTuple):
+    office_code: str
+    office_name: str
+    regions: Tuple[Region, ...]
+
+
+class Center(NamedTuple):
+    center_code: str
+    center_name: str
+    offices: Tuple[Office, ...]
+
+
+class DailyForecast(NamedTuple):
+    forecast_date: str
+    weather: str
+    max_temp: Optional[float]
+    min_temp: Optional[float]
+    pop: Optional[int]
+    weather_code: Optional[str] = None
+
+
+class FetchSnapshot(NamedTuple):
+    region_code: str
+    fetched_at: str
+    forecasts: Tuple[DailyForecast, ...]
+
+
+class HistoryPage(NamedTuple):
+    # 取得時刻（新しい順）と、続きを読むときに before に渡す値（もう無ければ None）
+    items: Tuple[str, ...]
+    next_before: Optional[str]
+
+
+# sqlite3 の row_factory 用
+def region_row(cursor, row):
+    return Region(*row)
+
+
+def forecast_row(cursor, row):
+    return DailyForecast(*row)
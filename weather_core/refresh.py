@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+
+from weather_core import metrics
+from weather_core.fetch import BACKOFF, JST, RETRIES, TIMEOUT, get_area, get_office_forecast
+from weather_core.parse import area_regions, parse_office_forecast, report_datetime
+from weather_core.store import init_db, save_regions_bulk, save_forecasts_many, get_watermarks
+
+MAX_WORKERS = 8
+
+
+def office_regions(regions):
+    # {office_code: [Region, ...]} にまとめる
+    offices = {}
+    for region in regions:
+        offices.setdefault(region.office_code, []).append(region)
+    return offices
+
+
+def fetch_with_retry(office_code, retries=RETRIES, backoff=BACKOFF, timeout=TIMEOUT):
+    # 取り直し（ゆらぎ付き）とブレーカーは取得処理（fetch.CachedFetcher）の側で行う
+    return get_office_forecast(office_code, timeout=timeout, retries=retries, backoff=backoff)
+
+
+def fetch_offices(office_codes, max_workers=MAX_WORKERS, retries=RETRIES, timeout=TIMEOUT):
+    # 同時接続数を max_workers に抑えて並列に取得する。失敗したオフィスは errors に入れる
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch_with_retry, code, retries, BACKOFF, timeout): code for code in office_codes}
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                results[code] = future.result()
+            except (requests.RequestException, ValueError) as e:
+                errors[code] = e
+    return results, errors
+
+
+def refresh_all(max_workers=MAX_WORKERS, retries=RETRIES, timeout=TIMEOUT, skip_unchanged=False):
+    # 全国の全オフィスを取得して、全地域の予報を1トランザクションで保存する
+    # skip_unchanged=True なら、前回保存時と reportDatetime が同じオフィスは保存しない
+    with metrics.timer("refresh"):
+        result = _refresh_all(max_workers, retries, timeout, skip_unchanged)
+    metrics.inc("offices_failed", len(result["errors"]))
+    metrics.inc("offices_skipped", result["skipped"])
+    return result
+
+
+def _refresh_all(max_workers, retries, timeout, skip_unchanged):
+    init_db()
+    regions = area_regions(get_area())
+    save_regions_bulk(regions)
+    offices = office_regions(regions)
+    results, errors = fetch_offices(offices.keys(), max_workers, retries, timeout)
+    previous = get_watermarks() if skip_unchanged else {}
+    checked_at = datetime.now(JST).isoformat(timespec="seconds")
+    rows_by_region = {}
+    reports = {}
+    watermarks = []
+    skipped = 0
+    for office_code, data in results.items():
+        reported = report_datetime(data)
+        if reported and previous.get(office_code, (None,))[0] == reported:
+            watermarks.append((office_code, reported, checked_at))
+            skipped += 1
+            continue
+        region_codes = [region.region_code for region in offices[office_code]]
+        try:
+            with metrics.timer("parse"):
+                parsed = parse_office_forecast(data, office_code, region_codes)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            # 形の崩れた予報は取得の失敗と同じく errors に入れ、ほかのオフィスは保存する
+            # ウォーターマークも進めない（次の取得で読み直す）
+            errors[office_code] = e
+            continue
+        watermarks.append((office_code, reported, checked_at))
+        for region_code, rows in parsed.items():
+            if rows:
+                rows_by_region[region_code] = rows
+                reports[region_code] = reported
+    inserted, _ = save_forecasts_many(rows_by_region, watermarks, reports)
+    return {"offices": len(watermarks), "regions": len(rows_by_region), "saved": inserted,
+            "skipped": skipped, "errors": errors}
@@ -0,0 +1,344 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+from weather_core import metrics
+from weather_core.records import FetchSnapshot, HistoryPage, forecast_row, region_row, to_float, to_int
+
+DB_PATH = "weather.db"
+HISTORY_PAGE = 20
+
+# SQL文は文字列を使い回すことで sqlite3 の文キャッシュ（プリペアドステートメント）に乗せる
+CREATE_REGIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS regions (
+        region_code TEXT PRIMARY KEY,
+        region_name TEXT,
+        office_code TEXT,
+        office_name TEXT
+    )
+"""
+CREATE_FORECASTS_SQL = """
+    CREATE TABLE IF NOT EXISTS forecasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        region_code TEXT,
+        forecast_date TEXT,
+        fetched_at TEXT,
+        weather TEXT,
+        max_temp REAL,
+        min_temp REAL,
+        pop INTEGER,
+        UNIQUE(region_code, forecast_date, fetched_at)
+    )
+"""
+# スキーマの変更履歴。PRAGMA user_version に適用済みの数を記録する
+MIGRATIONS = [
+    # 1: 最新スナップショット／履歴の検索用。(region_code, fetched_at) の順で引けるようにする
+    "CREATE INDEX IF NOT EXISTS idx_forecasts_region_fetched ON forecasts (region_code, fetched_at, forecast_date)",
+    # 2: 定期取得用。オフィスごとに最後に保存した reportDatetime と確認時刻を持つ
+    """
+    CREATE TABLE IF NOT EXISTS fetch_watermarks (
+        office_code TEXT PRIMARY KEY,
+        report_datetime TEXT,
+        checked_at TEXT
+    )
+    """,
+    # 3: 取得ごとのスナップショット。同じ発表・同じ内容なら新しいスナップショットを作らない
+    """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        region_code TEXT,
+        fetched_at TEXT,
+        report_datetime TEXT,
+        content_hash TEXT,
+        PRIMARY KEY (region_code, fetched_at)
+    )
+    """,
+    # 4: 天気コード。画面側の分類（アイコン・色）に使う
+    "ALTER TABLE forecasts ADD COLUMN weather_code TEXT",
+]
+INSERT_REGION_SQL = "INSERT OR IGNORE INTO regions VALUES (?, ?, ?, ?)"
+SELECT_REGIONS_SQL = "SELECT * FROM regions ORDER BY office_name, region_name"
+INSERT_FORECAST_SQL = """
+    INSERT INTO forecasts (region_code, forecast_date, fetched_at, weather, max_temp, min_temp, pop)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_FORECAST_OR_IGNORE_SQL = """
+    INSERT OR IGNORE INTO forecasts (region_code, forecast_date, fetched_at, weather, max_temp, min_temp, pop,
+                                     weather_code)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+UPSERT_WATERMARK_SQL = "INSERT OR REPLACE INTO fetch_watermarks VALUES (?, ?, ?)"
+SELECT_WATERMARKS_SQL = "SELECT office_code, report_datetime, checked_at FROM fetch_watermarks"
+# 取得時刻は重ならないように作るので、ぶつかったら無視せず IntegrityError にする
+INSERT_SNAPSHOT_SQL = "INSERT INTO snapshots VALUES (?, ?, ?, ?)"
+SELECT_LATEST_HASH_SQL = """
+    SELECT content_hash FROM snapshots
+    WHERE region_code = ?
+    ORDER BY fetched_at DESC LIMIT 1
+"""
+SELECT_LATEST_SQL = "SELECT MAX(fetched_at) FROM forecasts WHERE region_code = ?"
+SELECT_SNAPSHOT_SQL = """
+    SELECT forecast_date, weather, max_temp, min_temp, pop, weather_code
+    FROM forecasts
+    WHERE region_code = ? AND fetched_at = ?
+    ORDER BY forecast_date
+"""
+SELECT_HISTORY_SQL = """
+    SELECT DISTINCT fetched_at FROM forecasts
+    WHERE region_code = ?
+    ORDER BY fetched_at DESC
+"""
+# 履歴のページ読み。fetched_at をキーにして続きから読む（OFFSET を使わないので古いページでも速い）
+# 範囲の指定がないときは下限 "" / 上限 "~"（数字や空白より大きい）で、文を1つに保つ
+SELECT_HISTORY_PAGE_SQL = """
+    SELECT DISTINCT fetched_at FROM forecasts
+    WHERE region_code = ? AND fetched_at >= ? AND fetched_at < ?
+    ORDER BY fetched_at DESC LIMIT ?
+"""
+# 1日1件（その日の最後の取得）に間引いた版
+# GROUP BY だと範囲全体を並べ替えるので、「この日より前の最後の取得」をインデックスで1件ずつ引く
+SELECT_HISTORY_DAILY_SQL = """
+    WITH RECURSIVE days(fetched_at) AS (
+        SELECT (SELECT MAX(fetched_at) FROM forecasts
+                WHERE region_code = ?1 AND fetched_at >= ?2 AND fetched_at < ?3)
+        UNION ALL
+        SELECT (SELECT MAX(f.fetched_at) FROM forecasts f
+                WHERE f.region_code = ?1 AND f.fetched_at >= ?2 AND f.fetched_at < substr(days.fetched_at, 1, 10))
+        FROM days WHERE days.fetched_at IS NOT NULL
+        LIMIT ?4
+    )
+    SELECT fetched_at FROM days WHERE fetched_at IS NOT NULL
+"""
+
+
+def forecast_params(region_code, fetched_at, row):
+    # row: DailyForecast か (date, weather, max, min, pop) のタプル
+    date, weather, max_t, min_t, pop = row[:5]
+    weather_code = row[5] if len(row) > 5 else None
+    return (region_code, date, fetched_at, weather or "", to_float(max_t), to_float(min_t), to_int(pop),
+            weather_code)
+
+
+def content_hash(report_datetime, params):
+    # 発表時刻と（型変換後の）予報の中身から作るハッシュ
+    # 地域コードと取得時刻（fetched_at）は入れない。入れると取得のたびに変わり、同じ内容を見分けられない
+    h = hashlib.sha1(str(report_datetime).encode("utf-8"))
+    for row in params:
+        # (date, weather, max, min, pop, weather_code)
+        h.update(repr((row[1],) + row[3:]).encode("utf-8"))
+    return h.hexdigest()
+
+
+class WeatherStore:
+    # 接続を1本だけ持ち続ける。Fletのイベントは別スレッドから来るのでロックで守る
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.last_fetched = None  # 最後に使った取得時刻（fetched_at）
+        self.conn = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WALならNORMALでも壊れない（電源断で最後のコミットが消えることはある）
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA cache_size=-8000")  # 約8MB
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+
+    def init_db(self):
+        with self.lock, self.conn:
+            self.conn.execute(CREATE_REGIONS_SQL)
+            self.conn.execute(CREATE_FORECASTS_SQL)
+        self.migrate()
+
+    def migrate(self):
+        with self.lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                return
+            with self.conn:
+                for sql in MIGRATIONS[version:]:
+                    self.conn.execute(sql)
+                self.conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            # 新しいインデックスをプランナーに使わせるため統計を更新する
+            self.conn.execute("ANALYZE forecasts")
+
+    def save_region(self, region_code, region_name, office_code, office_name):
+        with self.lock, self.conn:
+            self.conn.execute(INSERT_REGION_SQL, (region_code, region_name, office_code, office_name))
+
+    def get_regions(self):
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.row_factory = region_row
+            return cur.execute(SELECT_REGIONS_SQL).fetchall()
+
+    def fetched_at(self):
+        # 取得時刻（マイクロ秒まで）。同じ秒に続けて保存しても UNIQUE にぶつからないよう、
+        # 前回と同じか前の時刻なら 1 マイクロ秒ずらす。ロックの中で呼ぶ
+        now = datetime.now()
+        if self.last_fetched is not None and now <= self.last_fetched:
+            now = self.last_fetched + timedelta(microseconds=1)
+        self.last_fetched = now
+        return now.isoformat(sep=" ", timespec="microseconds")
+
+    def save_forecast(self, region_code, date, weather, max_t, min_t, pop):
+        with self.lock, self.conn:
+            now = self.fetched_at()
+            self.conn.execute(INSERT_FORECAST_SQL, (region_code, date, now, weather,
+                                                    to_float(max_t), to_float(min_t), to_int(pop)))
+        return True
+
+    def _insert_many(self, sql, params):
+        # 1トランザクションで executemany し、(追加件数, 無視件数) を返す
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(sql, params)
+            inserted = self.conn.total_changes - before
+        return inserted, len(params) - inserted
+
+    def save_regions_bulk(self, rows):
+        # rows: Region（または同じ並びのタプル）
+        params = [tuple(r) for r in rows]
+        return self._insert_many(INSERT_REGION_SQL, params)
+
+    def save_forecasts_bulk(self, region_code, rows):
+        # rows: DailyForecast（または同じ並びのタプル）。型変換は書き込み前に全部済ませる
+        return self.save_forecasts_many({region_code: rows})
+
+    def save_forecasts_many(self, rows_by_region, watermarks=(), reports=None):
+        # 複数地域の予報を同じ取得時刻でまとめて1トランザクションで書く
+        # watermarks: (office_code, report_datetime, checked_at) の並び
+        # reports: {region_code: report_datetime}。前回と発表・内容が同じ地域は保存しない
+        reports = reports or {}
+        with self.lock:
+            now = self.fetched_at()
+        batches = []
+        total = 0
+        for region_code, rows in rows_by_region.items():
+            params = [forecast_params(region_code, now, row) for row in rows]
+            total += len(params)
+            if params:
+                batches.append((region_code, params, content_hash(reports.get(region_code), params)))
+        inserted = 0
+        with metrics.timer("db_write"), self.lock, self.conn:
+            for region_code, params, digest in batches:
+                latest = self.conn.execute(SELECT_LATEST_HASH_SQL, (region_code,)).fetchone()
+                if latest and latest[0] == digest:
+                    continue
+                before = self.conn.total_changes
+                self.conn.executemany(INSERT_FORECAST_OR_IGNORE_SQL, params)
+                inserted += self.conn.total_changes - before
+                self.conn.execute(INSERT_SNAPSHOT_SQL, (region_code, now, reports.get(region_code), digest))
+            # ウォーターマークは予報と同じトランザクションで更新する（途中で落ちても食い違わない）
+            self.conn.executemany(UPSERT_WATERMARK_SQL, [tuple(w) for w in watermarks])
+        metrics.inc("rows_inserted", inserted)
+        metrics.inc("rows_ignored", total - inserted)
+        return inserted, total - inserted
+
+    def get_watermarks(self):
+        # {office_code: (report_datetime, checked_at)}
+        with self.lock:
+            return {row[0]: (row[1], row[2]) for row in self.conn.execute(SELECT_WATERMARKS_SQL)}
+
+    def get_snapshot(self, region_code, fetched_at=None):
+        # fetched_at を省略すると最新の取得分。データがなければ None
+        with self.lock:
+            if not fetched_at:
+                fetched_at = self.conn.execute(SELECT_LATEST_SQL, (region_code,)).fetchone()[0]
+                if fetched_at is None:
+                    return None
+            cur = self.conn.cursor()
+            cur.row_factory = forecast_row
+            forecasts = tuple(cur.execute(SELECT_SNAPSHOT_SQL, (region_code, fetched_at)).fetchall())
+        if not forecasts:
+            return None
+        return FetchSnapshot(region_code, fetched_at, forecasts)
+
+    def get_forecasts(self, region_code, fetched_at=None):
+        snapshot = self.get_snapshot(region_code, fetched_at)
+        return list(snapshot.forecasts) if snapshot else []
+
+    def get_history(self, region_code):
+        with self.lock:
+            return [r[0] for r in self.conn.execute(SELECT_HISTORY_SQL, (region_code,)).fetchall()]
+
+    def get_history_page(self, region_code, before=None, limit=HISTORY_PAGE, since=None, until=None,
+                         per_day=False):
+        # 取得時刻を新しい順に limit 件。before より前から読む（前のページの next_before を渡す）
+        # since / until は日付（YYYY-MM-DD、両端を含む）。per_day=True なら1日1件に間引く
+        lower = str(since or "")
+        upper = before or "~"
+        if until:
+            end = (date.fromisoformat(str(until)) + timedelta(days=1)).isoformat()
+            upper = min(upper, end)
+        sql = SELECT_HISTORY_DAILY_SQL if per_day else SELECT_HISTORY_PAGE_SQL
+        with self.lock:
+            items = tuple(r[0] for r in self.conn.execute(sql, (region_code, lower, upper, limit)))
+        # 1日1件のときは最後まで読むと末尾に NULL が1行入るので、limit 件そろえば続きがある
+        if len(items) < limit:
+            return HistoryPage(items, None)
+        # 1日1件のときは、最後の日の残りを読まないように日付の頭から続ける
+        return HistoryPage(items, items[-1][:10] if per_day else items[-1])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# --- 今までの関数はこのストアを使う薄いラッパー ---
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = WeatherStore()
+        return _store
+
+
+def init_db():
+    get_store().init_db()
+
+
+def save_region(region_code, region_name, office_code, office_name):
+    get_store().save_region(region_code, region_name, office_code, office_name)
+
+
+def get_regions():
+    return get_store().get_regions()
+
+
+def save_forecast(region_code, date, weather, max_t, min_t, pop):
+    return get_store().save_forecast(region_code, date, weather, max_t, min_t, pop)
+
+
+def save_regions_bulk(rows):
+    return get_store().save_regions_bulk(rows)
+
+
+def save_forecasts_bulk(region_code, rows):
+    return get_store().save_forecasts_bulk(region_code, rows)
+
+
+def save_forecasts_many(rows_by_region, watermarks=(), reports=None):
+    return get_store().save_forecasts_many(rows_by_region, watermarks, reports)
+
+
+def get_watermarks():
+    return get_store().get_watermarks()
+
+
+def get_snapshot(region_code, fetched_at=None):
+    return get_store().get_snapshot(region_code, fetched_at)
+
+
+def get_forecasts(region_code, fetched_at=None):
+    return get_store().get_forecasts(region_code, fetched_at)
+
+
+def get_history(region_code):
+    return get_store().get_history(region_code)
+
+
+def get_history_page(region_code, before=None, limit=HISTORY_PAGE, since=None, until=None, per_day=False):
+    return get_store().get_history_page(region_code, before, limit, since, until, per_day)
@@ -0,0 +1,17 @@
+import threading
+
+
+class LatestOnly:
+    # 画面の処理を別スレッドで動かすときに、最後に始めたものだけ結果を反映させる
+    # 地域をすばやく切り替えても、古い取得結果が新しい表示を上書きしない
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+
+    def start(self):
+        with self.lock:
+            self.current += 1
+            return self.current
+
+    def is_current(self, token):
+        return token == self.current